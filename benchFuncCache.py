@@ -0,0 +1,157 @@
+import argparse
+from collections import namedtuple
+from collections import OrderedDict
+import random
+import time
+from twitch.FuncCache import FuncCache, _Cache
+
+
+# Micro-benchmarks for FuncCache and the LRU/TTL cache behind it.
+# Writes, reads and evictions are also timed on the cache this
+# one replaced, copied below, for comparison.
+#
+# Run from the repository root:
+#     python benchFuncCache.py
+#     python benchFuncCache.py --sizes 1000 100000 --lookups 500000
+#     python benchFuncCache.py --repeat 9
+
+
+BaselineItem = namedtuple("BaselineItem", ["data", "expiry"])
+
+
+# The previous cache: sliding expiry, checked only when an
+# entry is read, so expired entries stay until evicted.
+class BaselineCache(object):
+    def __init__(self, size, expiry):
+        self.size   = size
+        self.expiry = expiry
+        self.cache  = OrderedDict()
+
+    def _has_expired(self, key):
+        return self.cache[key].expiry < time.monotonic()
+
+    def __setitem__(self, key, value):
+        self.cache[key] = BaselineItem(value,
+                                       time.monotonic() + self.expiry)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.size:
+            self.cache.popitem(last = False)
+
+    def __getitem__(self, key):
+        if not self._has_expired(key):
+            self.cache[key] = BaselineItem(self.cache[key].data,
+                                           time.monotonic() + self.expiry)
+            self.cache.move_to_end(key)
+            return self.cache[key].data
+        else:
+            raise KeyError("Item has expired from cache.")
+
+
+IMPLEMENTATIONS = [("baseline", BaselineCache), ("current", _Cache)]
+
+
+# Prints the time per operation of a benchmark.
+def report(name, size, elapsed, operations):
+    print("%-28s size %7d: %8.0f ns/op"
+          % (name, size, elapsed / operations * 1e9))
+
+
+# Fills a cache with size entries, repeat times; reports the
+# fastest run, as this is the one least disturbed by the machine.
+def bench_write(name, cache_class, size, keys, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        cache = cache_class(size, 60.0)
+        start = time.perf_counter()
+        for key in keys:
+            cache[key] = key
+        best = min(best, time.perf_counter() - start)
+    report("write, %s" % name, size, best, len(keys))
+    return cache
+
+
+# Looks up random keys, all of them present.
+def bench_read(name, size, cache, lookups, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for key in lookups:
+            cache[key]
+        best = min(best, time.perf_counter() - start)
+    report("read (hit), %s" % name, size, best, len(lookups))
+
+
+# Writes past the size limit, so every write evicts an entry.
+def bench_evict(name, size, cache, keys, repeat):
+    best = float("inf")
+    for run in range(repeat):
+        start = time.perf_counter()
+        for key in keys:
+            cache[(run, key)] = key
+        best = min(best, time.perf_counter() - start)
+    report("write (evicting), %s" % name, size, best, len(keys))
+
+
+# Mixes entries stored with many different times to live, as
+# negative caching does, and reads them back.
+def bench_mixed_ttl(size, keys, lookups, ttls):
+    cache = _Cache(size, 60.0)
+    start = time.perf_counter()
+    for index, key in enumerate(keys):
+        cache.set(key, key, ttl = ttls[index % len(ttls)])
+    for key in lookups:
+        cache.get_entry(key)
+    report("mixed ttl (%d queues)" % len(ttls), size,
+           time.perf_counter() - start, len(keys) + len(lookups))
+
+
+# Lets every entry expire, then times the lookup which purges them.
+def bench_expire(size, keys):
+    cache = _Cache(size, 0.05)
+    for key in keys:
+        cache[key] = key
+    time.sleep(0.1)
+    start = time.perf_counter()
+    remaining = len(cache)
+    report("expire all", size, time.perf_counter() - start, len(keys))
+    assert remaining == 0, remaining
+
+
+# Calls a decorated function, as TwitchApi does.
+def bench_decorator(size, keys, lookups, thread_safe):
+    @FuncCache(size = size, expiry = 60.0, thread_safe = thread_safe)
+    def identity(key):
+        return key
+
+    for key in keys:
+        identity(key)
+    start = time.perf_counter()
+    for key in lookups:
+        identity(key)
+    report("decorator (%s)" % ("thread safe" if thread_safe else "plain"),
+           size, time.perf_counter() - start, len(lookups))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark FuncCache.")
+    parser.add_argument("--sizes", type = int, nargs = "+",
+                        default = [1000, 10000, 100000])
+    parser.add_argument("--lookups", type = int, default = 200000)
+    parser.add_argument("--seed", type = int, default = 1)
+    parser.add_argument("--repeat", type = int, default = 5)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    for size in args.sizes:
+        keys    = ["user%d" % i for i in range(size)]
+        lookups = [random.choice(keys) for _ in range(args.lookups)]
+
+        for name, cache_class in IMPLEMENTATIONS:
+            cache = bench_write(name, cache_class, size, keys, args.repeat)
+            bench_read(name, size, cache, lookups, args.repeat)
+            bench_evict(name, size, cache, keys, args.repeat)
+        bench_mixed_ttl(size, keys, lookups, [60.0 + i for i in range(50)])
+        bench_expire(size, keys)
+        bench_decorator(size, keys, lookups, False)
+        bench_decorator(size, keys, lookups, True)
+        print()
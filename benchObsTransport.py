@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+import obswebsocket
+import obswebsocket.requests
+from obs.ObsTransport import ObsTransport
+
+# Times OBS requests sent one after another through obs-websocket-py's obsws and
+# through ObsTransport, and sent all at once through ObsTransport, against a fake
+# obs-websocket 4.x server which answers after a chosen latency.
+#
+# Run from the repository root:
+#     python benchObsTransport.py
+#     python benchObsTransport.py --latency 0.05 --requests 8
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+PASSWORD = "password"
+
+class FakeObs:
+	"""Just enough of obs-websocket 4.x to log in and answer requests. Each request
+	is answered on its own after latency seconds, like a real server on a network.
+	"""
+
+	def __init__(self, latency):
+		self.latency = latency
+		self.salt = "salt"
+		self.challenge = "challenge"
+		self.loop = asyncio.new_event_loop()
+		self.ready = threading.Event()
+		thread = threading.Thread(target = self._run)
+		thread.daemon = True
+		thread.start()
+		self.ready.wait()
+
+	def _run(self):
+		asyncio.set_event_loop(self.loop)
+		server = self.loop.run_until_complete(asyncio.start_server(self._client, "127.0.0.1", 0))
+		self.port = server.sockets[0].getsockname()[1]
+		self.ready.set()
+		self.loop.run_forever()
+
+	async def _client(self, reader, writer):
+		# Websocket handshake
+		header = await reader.readuntil(b"\r\n\r\n")
+		key = [line.split(b":", 1)[1].strip() for line in header.split(b"\r\n") if line.lower().startswith(b"sec-websocket-key")][0]
+		accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID.encode()).digest())
+		writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+		try:
+			while True:
+				first, second = await reader.readexactly(2)
+				length = second & 0x7f
+				if(length == 126):
+					length = struct.unpack(">H", await reader.readexactly(2))[0]
+				elif(length == 127):
+					length = struct.unpack(">Q", await reader.readexactly(8))[0]
+				mask = await reader.readexactly(4) if second & 0x80 else b"\0\0\0\0"
+				data = bytes(byte ^ mask[index % 4] for index, byte in enumerate(await reader.readexactly(length)))
+				opcode = first & 0x0f
+				if(opcode == 8): # Close
+					break
+				if(opcode == 1): # Text
+					self.loop.create_task(self._reply(writer, json.loads(data)))
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+		finally:
+			writer.close()
+
+	async def _reply(self, writer, message):
+		await asyncio.sleep(self.latency)
+		data = json.dumps(self._answer(message)).encode()
+		if(len(data) < 126):
+			header = bytes([0x81, len(data)])
+		elif(len(data) < 65536):
+			header = bytes([0x81, 126]) + struct.pack(">H", len(data))
+		else:
+			header = bytes([0x81, 127]) + struct.pack(">Q", len(data))
+		writer.write(header + data)
+
+	def _answer(self, message):
+		answer = {"message-id": message.get("message-id"), "status": "ok"}
+		request_type = message["request-type"]
+		if(request_type == "GetAuthRequired"):
+			answer.update(authRequired = True, salt = self.salt, challenge = self.challenge)
+		elif(request_type == "Authenticate"):
+			secret = base64.b64encode(hashlib.sha256((PASSWORD + self.salt).encode()).digest())
+			auth = base64.b64encode(hashlib.sha256(secret + self.challenge.encode()).digest()).decode()
+			if(message.get("auth") != auth):
+				answer.update(status = "error", error = "Authentication Failed.")
+		elif(request_type == "GetVersion"):
+			answer.update({"obs-websocket-version": "4.9.1", "obs-studio-version": "27.0.0", "version": 1.1})
+		elif(request_type != "SetSceneItemRender"):
+			answer.update(status = "error", error = "invalid request type")
+		return answer
+
+def make_requests(count):
+	return [obswebsocket.requests.SetSceneItemRender("source {}".format(index), True, None) for index in range(count)]
+
+def report(name, count, elapsed):
+	print("{:<32} {} requests in {:.3f}s".format(name, count, elapsed))
+
+def bench_obsws(port, count):
+	client = obswebsocket.obsws("127.0.0.1", port, PASSWORD)
+	client.connect()
+	try:
+		start = time.perf_counter()
+		for request in make_requests(count):
+			client.call(request)
+		report("obsws, one after another", count, time.perf_counter() - start)
+	finally:
+		client.disconnect()
+
+def bench_transport(port, count):
+	transport = ObsTransport("127.0.0.1", port, PASSWORD)
+	transport.connect()
+
+	async def sequential():
+		for request in make_requests(count):
+			await transport.call_async(request)
+
+	async def pipelined():
+		await asyncio.gather(*[transport.call_async(request) for request in make_requests(count)])
+
+	try:
+		for name, run in (("ObsTransport, one after another", sequential), ("ObsTransport, all at once", pipelined)):
+			start = time.perf_counter()
+			asyncio.run(run())
+			report(name, count, time.perf_counter() - start)
+	finally:
+		transport.disconnect()
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "Benchmark ObsTransport against obsws.")
+	parser.add_argument("--latency", type = float, default = 0.02, help = "Seconds the fake server takes to answer")
+	parser.add_argument("--requests", type = int, default = 4)
+	args = parser.parse_args()
+
+	server = FakeObs(args.latency)
+	print("Fake OBS Websockets on port {}, answering after {:.0f} ms".format(server.port, args.latency * 1000))
+	bench_obsws(server.port, args.requests)
+	bench_transport(server.port, args.requests)
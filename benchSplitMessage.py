@@ -0,0 +1,78 @@
+import argparse
+import random
+import time
+from twitch.ChatScheduler import split_message, message_budget, TWITCH_MAX_CHARS
+
+
+# Benchmark for split_message, on a generated corpus of chat
+# messages in many scripts, with accents and emoji sequences.
+#
+# Run from the repository root:
+#     python benchSplitMessage.py
+#     python benchSplitMessage.py --messages 10000 --seed 2
+
+
+# Words from several scripts, so messages mix 1 to 4 byte
+# characters, combining accents and zero width joiners.
+WORDS = [
+    "birb", "tiel", "chirp", "a" * 30,
+    "naïve", "é", "ø", "crème",
+    "日本語のテキスト", "한국어", "中文消息",
+    "Привет", "ελληνικά", "مرحبا", "שלום", "नमस्ते",
+    "😀", "👩‍👩‍👧‍👦", "🏳️‍🌈", "👍🏽",
+]
+
+# Messages which can only be split within a word.
+UNBROKEN = [
+    "😀" * 600,
+    "é" * 400,
+    "👩‍👩‍👧‍👦" * 100,
+    "x" * 2000,
+]
+
+
+# Generates count messages of 50 to 400 random words.
+def generate_corpus(count, seed):
+    rng = random.Random(seed)
+    corpus = [" ".join(rng.choice(WORDS)
+                       for _ in range(rng.randint(50, 400)))
+              for _ in range(count)]
+    return corpus + UNBROKEN
+
+
+# Checks that every piece fits and that no text was lost.
+def check(text, pieces, budget):
+    for piece in pieces:
+        assert piece, "empty piece"
+        assert len(piece.encode("utf-8")) <= budget, len(piece.encode("utf-8"))
+        assert len(piece) <= TWITCH_MAX_CHARS, len(piece)
+    if text in UNBROKEN:
+        assert "".join(pieces) == text
+        assert not any(piece.startswith("\u0301") for piece in pieces)
+    else:
+        assert " ".join(pieces).split() == text.split()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark split_message.")
+    parser.add_argument("--messages", type = int, default = 2000)
+    parser.add_argument("--seed", type = int, default = 1)
+    parser.add_argument("--nickname", default = "TinaTielBot")
+    parser.add_argument("--channel", default = "#tinatiel")
+    args = parser.parse_args()
+
+    budget = message_budget(args.nickname, args.channel)
+    corpus = generate_corpus(args.messages, args.seed)
+    size   = sum(len(text.encode("utf-8")) for text in corpus)
+    print("Corpus: %d messages, %.1f MB; budget %d bytes per message"
+          % (len(corpus), size / 1e6, budget))
+
+    start = time.perf_counter()
+    pieces = [split_message(text, budget) for text in corpus]
+    elapsed = time.perf_counter() - start
+
+    for text, split in zip(corpus, pieces):
+        check(text, split, budget)
+    print("Split into %d messages in %.3fs: %.1f MB/s, %.1f us per message"
+          % (sum(len(split) for split in pieces), elapsed,
+             size / 1e6 / elapsed, elapsed / len(corpus) * 1e6))
@@ -11,7 +11,7 @@ class MockTwitchBot():
 		self.twitch_config = twitch_config
 		self.obs_client = ObsClient(obs_config, self)
 
-	def twitch_say(self, message):
+	def twitch_say(self, message, supersede = None):
 		self.log.debug("Twitch Bot: recieved say '{}'".format(message))
 
 	def twitch_done(self):
@@ -123,7 +123,7 @@ def main():
 	#testbot.obs_client.execute(broadcaster, 'birb')
 	#testbot.obs_client.execute(user1, 'tiel') #alias for birb
 	#testbot.obs_client.execute(broadcaster, 'help')
-	testbot.obs_client.execute(broadcaster, 'chain')
+	testbot.obs_client.execute(broadcaster, 'chain').result() # commands run in the background, wait for it
 
 	#testbot.obs_client.execute(broadcaster, 'letschat')
 	#testbot.obs_client.execute(broadcaster, 'letsplay')
@@ -0,0 +1,89 @@
+# Runs actions without blocking the bot's main loop
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
+
+class ActionEngine:
+	"""Runs actions on an asyncio event loop in a thread of its own, so that timed
+	actions wait by scheduling their next step instead of sleeping, and several
+	commands can be in progress at the same time.
+
+	Each action declares the OBS resources (scene items, the current scene) it
+	touches. Commands with no resources in common run in parallel, while commands
+	sharing a resource run one after another, in the order they were submitted.
+	"""
+
+	def __init__(self, obs_client, max_workers = 4):
+		self.log = logging.getLogger(__name__)
+		self.obs_client = obs_client
+		self.loop = asyncio.new_event_loop()
+		self.executor = ThreadPoolExecutor(max_workers, "ObsCall")
+		self.loop.set_default_executor(self.executor)
+		self.resource_locks = {}
+
+		self.thread = threading.Thread(target = self._run_loop)
+		self.thread.name = "ObsActionEngineThread"
+		self.thread.daemon = True
+		self.thread.start()
+
+	def _run_loop(self):
+		asyncio.set_event_loop(self.loop)
+		self.loop.run_forever()
+
+	def submit(self, coro):
+		"""Schedules a coroutine on the engine from any thread, returning a
+		concurrent.futures.Future for its result
+		"""
+		return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+	async def run(self, action, user):
+		"""Executes an action and returns whether it succeeded. Coroutine actions
+		run on the loop; older synchronous actions run on the executor so they
+		cannot block it.
+		"""
+		if asyncio.iscoroutinefunction(action.execute):
+			return await action.execute(user)
+		return await self.loop.run_in_executor(None, action.execute, user)
+
+	async def call(self, request):
+		"""Sends a request to OBS without blocking the loop. Requests from any number
+		of actions are in flight at the same time.
+		"""
+		return await self.obs_client.client.call_async(request)
+
+	async def call_batch(self, requests, abort_on_fail = False):
+		"""Sends several requests to OBS to be carried out together, see
+		ObsTransport.call_batch_async
+		"""
+		return await self.obs_client.client.call_batch_async(requests, abort_on_fail)
+
+	async def run_exclusive(self, action, user, on_start = None):
+		"""Executes an action while holding the locks for all of its resources.
+		Locks are always taken in sorted order, so two commands can never each hold
+		a lock the other is waiting for. on_start, if given, is called once the
+		locks are held, right before the action runs.
+		"""
+		async with AsyncExitStack() as stack:
+			for key in sorted(action.resources()):
+				await stack.enter_async_context(self.resource_lock(key))
+			if(on_start is not None):
+				on_start()
+			return await self.run(action, user)
+
+	def resource_lock(self, key):
+		"""Returns the lock for a resource such as a scene item. Only call this from
+		the engine's loop.
+		"""
+		lock = self.resource_locks.get(key, None)
+		if(lock is None):
+			lock = asyncio.Lock()
+			self.resource_locks[key] = lock
+		return lock
+
+	def stop(self):
+		"""Stops the loop and waits for the engine thread to finish"""
+		self.loop.call_soon_threadsafe(self.loop.stop)
+		self.thread.join()
+		self.executor.shutdown()
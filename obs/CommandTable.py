@@ -0,0 +1,58 @@
+# Finds the command for a name typed in chat
+import logging
+
+class CommandTable:
+	"""Maps every name a command can be called by (its name and aliases, in lower
+	case) to the command. It is built once when the commands are loaded and not
+	changed afterwards, so looking up a command is a single dict lookup and a new
+	table can replace an old one in one step.
+
+	With min_prefix_length set, a command can also be called by any abbreviation of
+	one of its names which is at least that long and doesn't also abbreviate a
+	different command, e.g. !bir for !birb.
+	"""
+
+	def __init__(self, min_prefix_length = 0):
+		self.log = logging.getLogger(__name__)
+		self.min_prefix_length = min_prefix_length
+		self.commands = {} # name or alias: command
+		self.prefixes = {} # abbreviation: command
+
+	def add(self, command_obj, aliases = None):
+		"""Adds a command under its name and aliases, which are matched in any case"""
+		for name in [command_obj.command_name] + list(aliases or []):
+			name = str(name).lower()
+			other = self.commands.get(name, None)
+			if(other is not None and other is not command_obj):
+				self.log.warn("Command '{}': Error, the name '{}' is already used by command '{}'".format(command_obj.command_name, name, other.command_name))
+				continue
+			self.commands[name] = command_obj
+
+	def compile(self):
+		"""Works out the abbreviations, once all the commands were added"""
+		if(self.min_prefix_length <= 0):
+			return self
+
+		candidates = {}
+		for name, command_obj in self.commands.items():
+			for length in range(self.min_prefix_length, len(name)):
+				candidates.setdefault(name[:length], set()).add(command_obj)
+
+		# Full names always win over abbreviations, and ambiguous abbreviations match nothing
+		self.prefixes = dict(
+			(prefix, next(iter(command_objs)))
+			for prefix, command_objs in candidates.items()
+			if len(command_objs) == 1 and prefix not in self.commands
+		)
+		return self
+
+	def lookup(self, name):
+		"""Returns the command called name, or None if there isn't one"""
+		name = name.lower()
+		command_obj = self.commands.get(name, None)
+		if(command_obj is None and self.prefixes):
+			command_obj = self.prefixes.get(name, None)
+		return command_obj
+
+	def __contains__(self, name):
+		return self.lookup(name) is not None
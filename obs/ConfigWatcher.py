@@ -0,0 +1,69 @@
+# Notices when config.json changes, so the commands can be reloaded
+import json
+import logging
+import os
+import threading
+
+class ConfigWatcher:
+	"""Checks every interval seconds whether a configuration file was modified, and
+	if so reads it and calls on_change with its contents. Checking only looks at the
+	file's modification time and size, so it costs next to nothing while the file
+	stays the same.
+
+	A file which can't be read or isn't valid JSON, e.g. while it's still being
+	saved, is skipped; it's read again once it's modified again.
+	"""
+
+	def __init__(self, path, on_change, interval = 1.0):
+		self.log = logging.getLogger(__name__)
+		self.path = path
+		self.on_change = on_change
+		self.interval = interval
+		self.stopped = threading.Event()
+		self.thread = None
+		self.last_seen = self._signature()
+
+	def start(self):
+		self.thread = threading.Thread(target = self._run)
+		self.thread.name = "ConfigWatcherThread"
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self):
+		self.stopped.set()
+		if(self.thread is not None and self.thread is not threading.current_thread()):
+			self.thread.join()
+		self.thread = None
+
+	def _signature(self):
+		try:
+			stat = os.stat(self.path)
+		except OSError:
+			return None
+		return (stat.st_mtime_ns, stat.st_size)
+
+	def _run(self):
+		while(not self.stopped.wait(self.interval)):
+			self.check()
+
+	def check(self):
+		"""Reads the file and calls on_change if it changed since the last check"""
+		signature = self._signature()
+		if(signature is None or signature == self.last_seen):
+			return False
+		self.last_seen = signature
+
+		try:
+			with open(self.path, encoding = 'utf-8') as json_file:
+				data = json.load(json_file)
+		except (OSError, ValueError) as e:
+			self.log.warn("Not reloading {}, could not read it: {}".format(self.path, e))
+			return False
+
+		self.log.info("{} changed, reloading...".format(self.path))
+		try:
+			self.on_change(data)
+		except Exception as e:
+			self.log.error("Could not reload {}! Error: {}".format(self.path, e))
+			return False
+		return True
@@ -1,9 +1,20 @@
 # This class is responsible for making stuff happen in OBS
 import obswebsocket, obswebsocket.requests
+import asyncio
+import json
 import logging
+import threading
 import time
+from collections import Counter
 from importlib import import_module
+from obswebsocket.exceptions import ConnectionFailure, MessageTimeout
 from obs.Permission import Permission
+from obs.ActionEngine import ActionEngine
+from obs.ObsTransport import ObsTransport
+from obs.ObsState import ObsState
+from obs.ObsSupervisor import ObsSupervisor
+from obs.CommandTable import CommandTable
+from obs.VoteEngine import VoteEngine
 #from obs.actions.Help import Help
 
 class ObsClient:
@@ -13,66 +24,154 @@ class ObsClient:
 	def __init__(self, conf, twitch_bot):
 		self.log = logging.getLogger(__name__)
 		self._load_config(conf)
-		self._connect()
-		self._init_commands()
 		self.twitch_bot = twitch_bot
 		self.max_attempts = 3 
+		self.connect_lock = threading.Lock()
+		self.reload_lock = threading.Lock()
+		self.state = ObsState()
+		self.votes = VoteEngine(self.vote_window, self.vote_weights)
+		self.engine = ActionEngine(self, self.max_workers)
+		self.supervisor = ObsSupervisor(self,
+			heartbeat_interval = self.heartbeat_interval,
+			queue_timeout = self.queue_timeout)
+		self._connect()
+		self._init_commands()
+		self.supervisor.start()
 
 	def execute(self, user, command_name):
 		"""Executes a given command with an user. The command is a string corresponding
 		to a class in the actions package, which is dynamically loaded if configured
 		correctly.
+
+		The command runs in the background on the action engine; this returns a
+		concurrent.futures.Future which resolves to whether the command succeeded.
+		The twitch bot is told the command failed as soon as it is refused, and that
+		it is done once it starts, so commands touching other resources can be
+		accepted while it runs.
 		"""
-		command_name = command_name.lower()
 		# Verify if the command exists
-		command = self.commands.get(command_name, None)
+		command = self.dispatch.lookup(command_name)
 		if(command is None):
 			#self.log.warn("User error: '{}' tried to execute unknown or misconfigured command '{}'".format(user['name'], command_name))
 			return self.twitch_bot.twitch_failed()
 
-		# Execute the function with args, returning its message
-		try:
-			return command.execute(user) # Command class must call twitch_done() or twich_failed() on twitch_bot, it is not done here!
-		except Exception as e:
-			self.log.error("Could not execute command (Exception: {}), most likely an issue with the OBS connection. Trying to reconnect...".format(str(e)))
-			if(not self.reconnect()):
-				self.twitch_bot.twitch_say("Could not execute command !{} after {} attempts @{}! Ensure OBS Websockets is available and restart the bot".format(
+		command_name = command.command_name
+		return self.engine.submit(self._execute(user, command_name, command))
+
+	async def _execute(self, user, command_name, command):
+		"""Runs a command on the action engine and tells the twitch bot how it went,
+		exactly once: failed if the command is refused or cannot start, otherwise done
+		(or failed, for commands without cooldown) as soon as it holds its resources.
+		Synchronous actions check permission and votes and report themselves.
+		While OBS is disconnected the command waits for the supervisor to reconnect,
+		and if the connection fails during the command it is tried once more.
+		"""
+		reported = False
+		def report(done):
+			nonlocal reported
+			if(reported):
+				return
+			reported = True
+			if(done):
+				self.twitch_bot.twitch_done()
+			else:
+				self.twitch_bot.twitch_failed()
+
+		asynchronous = asyncio.iscoroutinefunction(command.execute)
+		on_start = (lambda: report(command.cooldown)) if asynchronous else None
+		for attempt in range(2):
+			if(not await self.supervisor.wait_connected()):
+				self.log.warn("Rejected command {}, OBS is disconnected".format(command_name))
+				self.twitch_bot.twitch_say("Could not execute command !{}, OBS is disconnected. {} @{}".format(
 					command_name,
-					self.max_attempts,
+					self.supervisor.status(),
 					self.twitch_bot.channel.split("#", 1)[1]
 				))
-				self.twitch_bot.twitch_failed()
-			else:
-				return self.execute(user, command_name)
+				report(False)
+				return False
 
-	def reconnect(self):
-		try:
-			self.disconnect()
-		except:
-			pass
+			# Check permission and votes only once, a retry was already accepted
+			if(attempt == 0 and asynchronous and not command.accepts(user)):
+				report(False)
+				return False
 
-		attempt = 0
-		while attempt < self.max_attempts:
-			self.log.warn("OBS reconnect attempt #{}".format(attempt+1))
-			attempt += 1
+			# Execute the function with args, returning its message
 			try:
-				self._connect()
+				return await self.engine.run_exclusive(command, user, on_start)
+			except (ConnectionFailure, MessageTimeout, OSError) as e:
+				self.log.error("Could not execute command (Exception: {}), most likely an issue with the OBS connection. Waiting for reconnect...".format(str(e)))
+				self.supervisor.connection_lost(str(e))
 			except Exception as e:
-				continue
-			else:
+				self.log.error("Could not execute command {}! Exception: {}".format(command_name, e))
+				report(False)
+				return False
+
+		report(False)
+		return False
+
+	@property
+	def commands(self):
+		"""All the commands, by name and by alias"""
+		return self.dispatch.commands
+
+	def is_known_command(self, command_name):
+		"""Whether execute() would find a command by this name"""
+		return self.dispatch.lookup(command_name) is not None
+
+	async def call(self, request):
+		"""Sends a request to OBS from an action without blocking other actions.
+		Requests are pipelined, so to send several at once await them together,
+		e.g. with asyncio.gather(), and they all take about one round trip.
+		"""
+		return await self.engine.call(request)
+
+	async def call_batch(self, requests, abort_on_fail = False):
+		"""Sends several requests to OBS to be carried out together, in one round trip
+		and in a single pass through OBS where it supports that (obs-websocket 4.9 or
+		later), so they show up on screen at the same time. Returns the requests, each
+		filled in with its answer; check each one's status.
+		"""
+		return await self.engine.call_batch(requests, abort_on_fail)
+
+	def reconnect(self):
+		"""Reconnects right away, trying up to max_attempts times with a short
+		backoff in between, and returns whether it worked. The supervisor reconnects
+		by itself; this is for when the broadcaster asks for it.
+		"""
+		for attempt in range(self.max_attempts):
+			if(attempt > 0):
+				time.sleep(self.supervisor.backoff(attempt - 1))
+			self.log.warn("OBS reconnect attempt #{}".format(attempt+1))
+			if(self._reconnect_once()):
+				self.supervisor.connection_restored()
 				return True
 		return False
 
+	def _reconnect_once(self):
+		"""Replaces the connection with a new one, returning whether that worked"""
+		with self.connect_lock:
+			try:
+				self.client.disconnect()
+			except Exception:
+				pass
+
+			try:
+				self._connect()
+			except Exception as e:
+				return False
+			return True
+
 	def disconnect(self):
 		"""Disconnects the OBS client websocket. Should be called when 
 		the process ends, NOT after every call
 		"""
+		self.supervisor.stop()
 		self.client.disconnect()
 		self.log.info("disconnected OBS Websocket _connection.")
 
 	def getVersion(self):
 		try:
-			message = self.client.call(obswebsocket.requests.GetVersion()).getObsWebsocketVersion()
+			message = self.engine.submit(self.call(obswebsocket.requests.GetVersion())).result().getObsWebsocketVersion()
 		except Exception as e:
 			message = "Could not communicate with OBS. Exception: " + str(e)
 		return message
@@ -87,6 +186,17 @@ class ObsClient:
 		self.port = conf.get('port', None)
 		self.password = conf.get('password', None)
 		self.conf_commands = conf.get('commands', None)
+		self.max_workers = conf.get('max_workers', 4) # Optional, how many older synchronous actions can run at once
+		self.heartbeat_interval = conf.get('heartbeat_interval', 5.0) # Optional, seconds between connection checks
+		self.queue_timeout = conf.get('queue_timeout', 10.0) # Optional, how long commands wait for OBS to reconnect
+		self.min_prefix_length = conf.get('min_prefix_length', 0) # Optional, shortest abbreviation of a command that works, 0 to disable
+		self.vote_window = conf.get('vote_window', 300.0) # Optional, seconds a vote counts for
+		self.vote_weights = {} # Optional, how much a vote counts by permission level, 1 by default
+		for permission_str, weight in conf.get('vote_weights', {}).items():
+			try:
+				self.vote_weights[Permission[permission_str]] = float(weight)
+			except (KeyError, TypeError, ValueError):
+				self.log.warn("Error, vote weight '{}' for '{}' is invalid, permission must be one of: {}".format(weight, permission_str, Permission.__members__))
 
 		if(   self.host is None
 			 or self.port is None
@@ -100,81 +210,143 @@ class ObsClient:
 		"""Initializes the commands as objects, so that they can have state and for
 		example to keep an internal vote count
 		"""
-		self.commands = {}
 		self.log.info("Initializing commands...")
+		self.dispatch, self.command_confs, vote_windows, _ = self._build_dispatch(self.conf_commands)
+		self.votes.set_windows(vote_windows)
+		self.log.info("...Commands initialized: {}".format(
+				list( self.commands.keys()) 
+			)
+		)
+
+	def reload_commands(self, conf):
+		"""Replaces the commands with the ones in conf, the obs section of config.json,
+		while the bot keeps running. Only new commands and commands whose configuration
+		changed are built again; the others are kept as they are, along with their
+		state. The new commands replace the old ones in a single step, so a chat
+		command is always looked up in either the old or the new set of commands.
+		Commands already running finish as they were.
+		"""
+		conf_commands = conf.get('commands', None)
+		if(conf_commands is None):
+			self.log.warn("Not reloading commands, missing 'commands' in the OBS configuration!")
+			return False
+
+		with self.reload_lock:
+			started = time.monotonic()
+			self.min_prefix_length = conf.get('min_prefix_length', self.min_prefix_length)
+			dispatch, command_confs, vote_windows, changes = self._build_dispatch(conf_commands, self.dispatch, self.command_confs)
+			removed = set(self.command_confs) - set(command_confs)
+			for command_name in removed:
+				self.votes.forget(command_name)
+			self.conf_commands = conf_commands
+			self.dispatch, self.command_confs = dispatch, command_confs
+			# Only once the new commands are in place, so a command never counts its
+			# votes with another configuration's window
+			self.votes.set_windows(vote_windows)
+
+		self.log.info("Reloaded commands in {:.0f} ms: {} added, {} changed, {} removed, {} unchanged".format(
+			(time.monotonic() - started) * 1000,
+			changes['added'], changes['changed'], len(removed), changes['unchanged']))
+		return True
+
+	def _build_dispatch(self, conf_commands, previous = None, previous_confs = None):
+		"""Builds a CommandTable with the commands in conf_commands, reusing the
+		commands in previous whose configuration is the same as in previous_confs.
+		Returns the table, the configuration of each command, the vote window of each
+		command, and a Counter of the commands added, changed and unchanged.
+		"""
+		dispatch = CommandTable(self.min_prefix_length)
+		command_confs = {}
+		vote_windows = {}
+		changes = Counter()
 		# Get all the commands and iterate over them
-		for command in self.conf_commands:
-			
-			# Verify the necessary config elements exist at all
+		for command in conf_commands:
+
 			disabled = command.get('disabled', False) # Disabled is optional, defaults to False
 			if(disabled == True):
 				continue;
 			command_name = command.get('name', "unknown").lower()
-			description = command.get('description', "")
-			permission_str = command.get('permission', None)
-			action = command.get('action', None)
-			min_votes = command.get('min_votes', None)
-			args = command.get('args', None)
 			aliases = command.get('aliases', None)
-			if(command_name is None 
-				or permission_str is None 
-				or action is None 
-				or min_votes is None 
-				or args is None):
-				self.log.warn("Command '{}': Error, missing 'permission', 'action', 'min_votes', or 'args' elements for command ".format(command_name))
-				continue
-
-			# Verify the votes and permission string are valid
-			if(min_votes < 0):
-				self.log.warn("Command '{}': Error, min_votes cannot be less than zero for command {}".format(command_name, min_votes))
-				continue
-			else:
-				self.log.debug("Command '{}': minimum votes is {}".format(command_name, min_votes))
-
-			try:
-				permission = Permission[permission_str]
-				self.log.debug("Command '{}': permission is {}".format(command_name, permission))
-			except Exception as e:
-				self.log.warn("Command '{}': Error, permission string '{}' is invalid, must be one of: {}".format(command_name, permission_str, Permission.__members__))
-				continue
-
-			# Try to get the corresponding action class
-			try:
-				module = import_module("obs.actions."+action)
-				class_ = getattr(module, action)
-				self.log.debug("Command {}: action is {}".format(command_name, class_))
-			except Exception as e:
-				self.log.warn("Command '{}': Error, no such action {} is defined. Full error: {}".format(command_name, action, e))
-				continue
 
-			# Try to instantiate the action class
-			try:
-				self.log.debug("Command {}: args are: {}".format(command_name, args))
-				command_obj = class_(self, command_name, aliases, description, permission, min_votes, args)
-			except ValueError as e:
-				self.log.warn(e)
-				continue
-
-			# Add command_obj to internal reference
-			self.commands[command_name] = command_obj
+			# Keep the command as it is if its configuration didn't change, including
+			# the steps of a Chain, which are part of its args
+			command_conf = json.dumps(command, sort_keys = True)
+			command_obj = None
+			if(previous_confs is not None and previous_confs.get(command_name, None) == command_conf):
+				command_obj = previous.commands.get(command_name, None)
+			if(command_obj is not None):
+				changes['unchanged'] += 1
+			else:
+				command_obj = self._build_command(command_name, command)
+				if(command_obj is None):
+					continue
+				changes['changed' if previous_confs and command_name in previous_confs else 'added'] += 1
+			command_confs[command_name] = command_conf
+			vote_windows[command_name] = command.get('vote_window', None) # Optional, overrides obs.vote_window
 
-			# If there are aliases, add them too
-			
+			# Add command_obj to internal reference, with its aliases if there are any
 			if(not aliases is None and isinstance(aliases, (list,) )):
 				self.log.debug("Command '{}': Found aliases {}".format(command_name, aliases))
-				for alias in aliases:
-					self.commands[alias] = command_obj
+				dispatch.add(command_obj, aliases)
 			else:
 				self.log.debug("Command '{}': No aliases".format(command_name, aliases))
+				dispatch.add(command_obj)
 
 		# Finally after all commands have been initialized then add the help command
 		#self.commands['help'] = Help(self)
 
-		# Done initializing
-		self.log.info("...Commands initialized: {}".format(
-				list( self.commands.keys()) 
-			)
-		)
+		# Done initializing, work out the abbreviations once rather than per message
+		return dispatch.compile(), command_confs, vote_windows, changes
+
+	def _build_command(self, command_name, command):
+		"""Creates the action object for one command of the configuration, or returns
+		None if its configuration is invalid
+		"""
+		# Verify the necessary config elements exist at all
+		description = command.get('description', "")
+		permission_str = command.get('permission', None)
+		action = command.get('action', None)
+		min_votes = command.get('min_votes', None)
+		args = command.get('args', None)
+		aliases = command.get('aliases', None)
+		if(command_name is None 
+			or permission_str is None 
+			or action is None 
+			or min_votes is None 
+			or args is None):
+			self.log.warn("Command '{}': Error, missing 'permission', 'action', 'min_votes', or 'args' elements for command ".format(command_name))
+			return None
+
+		# Verify the votes and permission string are valid
+		if(min_votes < 0):
+			self.log.warn("Command '{}': Error, min_votes cannot be less than zero for command {}".format(command_name, min_votes))
+			return None
+		else:
+			self.log.debug("Command '{}': minimum votes is {}".format(command_name, min_votes))
+
+		try:
+			permission = Permission[permission_str]
+			self.log.debug("Command '{}': permission is {}".format(command_name, permission))
+		except Exception as e:
+			self.log.warn("Command '{}': Error, permission string '{}' is invalid, must be one of: {}".format(command_name, permission_str, Permission.__members__))
+			return None
+
+		# Try to get the corresponding action class
+		try:
+			module = import_module("obs.actions."+action)
+			class_ = getattr(module, action)
+			self.log.debug("Command {}: action is {}".format(command_name, class_))
+		except Exception as e:
+			self.log.warn("Command '{}': Error, no such action {} is defined. Full error: {}".format(command_name, action, e))
+			return None
+
+		# Try to instantiate the action class
+		try:
+			self.log.debug("Command {}: args are: {}".format(command_name, args))
+			return class_(self, command_name, aliases, description, permission, min_votes, args)
+		except ValueError as e:
+			self.log.warn(e)
+			return None
 
 	def _connect(self):
 		"""Initiates connection with OBS Websockets, and will raise an exception 
@@ -183,8 +355,10 @@ class ObsClient:
 		self.log.info("Trying to connect to OBS Websockets...")
 
 		try:
-				self.client = obswebsocket.obsws(self.host, self.port, self.password)
+				self.client = ObsTransport(self.host, self.port, self.password,
+					on_close = lambda: self.supervisor.connection_lost("connection closed"))
 				self.client.connect()
+				self.state.attach(self.client)
 				self.log.info("...Connected to OBS Websockets at {}:{}".format(self.host, self.port))
 		except Exception as e:
 			self.log.error("Could not initialize connection at {}:{} to OBS Websockets! Exception: {}".format(self.host, self.port, e))
@@ -0,0 +1,159 @@
+# Keeps a local copy of the parts of OBS the actions need to know about
+import logging
+import threading
+import obswebsocket, obswebsocket.requests
+
+class ObsState:
+	"""A mirror of the state of OBS: the current scene, the items in each scene
+	and whether they are visible, and the items in each group. It is read from OBS
+	once when connecting and then kept up to date by the events OBS sends, so
+	actions can look things up without asking OBS.
+
+	Visibility changes and scene switches are applied as they come in. Scene
+	switches the bot makes itself are also applied as soon as OBS answers them,
+	before the action which asked gets the answer, since OBS may send the
+	SwitchScenes event only after that answer. Changes to the structure, such as
+	items being added, removed or renamed, make the mirror read the scene list from
+	OBS again in the background.
+
+	Lookups return None for anything the mirror doesn't know about (yet), in which
+	case the caller should ask OBS instead.
+	"""
+
+	# Events after which the whole scene list is read again
+	structure_events = set([
+		'ScenesChanged',
+		'SceneCollectionChanged',
+		'SceneItemAdded',
+		'SceneItemRemoved',
+		'SourceRenamed',
+		'SourceDestroyed',
+	])
+
+	def __init__(self):
+		self.log = logging.getLogger(__name__)
+		self.lock = threading.Lock()
+		self.transport = None
+		self.loaded = False
+		self.current_scene = None
+		self.scenes = {} # scene name: {item name: visible}
+		self.groups = {} # group name: [item names]
+		self.refreshing = False
+		self.refresh_again = False
+
+	def attach(self, transport):
+		"""Follows the events of a newly connected transport and reads the scene list.
+		Called on every (re)connect, since events may have been missed meanwhile.
+		"""
+		with self.lock:
+			self.transport = transport
+			self.loaded = False
+		transport.register(self._on_event)
+		transport.watch_answers(self._on_answer)
+		self._load(transport.call(obswebsocket.requests.GetSceneList()))
+
+	def get_current_scene(self):
+		with self.lock:
+			return self.current_scene if self.loaded else None
+
+	def is_visible(self, item, scene = None):
+		"""Whether an item is visible in a scene, the current scene by default"""
+		with self.lock:
+			if(not self.loaded):
+				return None
+			return self.scenes.get(scene or self.current_scene, {}).get(item, None)
+
+	def group_items(self, group):
+		"""Returns the names of the items in a group"""
+		with self.lock:
+			if(not self.loaded or group not in self.groups):
+				return None
+			return list(self.groups[group])
+
+	def _load(self, res):
+		"""Replaces the mirror with the answer to a GetSceneList request"""
+		if(not res.status):
+			self.log.warn("Could not read the OBS scene list! Error: {}".format(res.datain.get('error', None)))
+			return
+
+		scenes = {}
+		groups = {}
+		for scene in res.getScenes():
+			scenes[scene['name']] = self._read_items(scene.get('sources', []), scenes, groups)
+
+		with self.lock:
+			self.current_scene = res.getCurrentScene()
+			self.scenes = scenes
+			self.groups = groups
+			self.loaded = True
+		self.log.debug("OBS state loaded: current scene {}, {} scenes, {} groups".format(res.getCurrentScene(), len(scenes), len(groups)))
+
+	def _read_items(self, sources, scenes, groups):
+		"""Returns the visibility of each item, and adds any groups among them. OBS
+		treats a group as a scene of its own, named after the group, so its items
+		are kept as one too.
+		"""
+		items = {}
+		for source in sources:
+			items[source['name']] = source.get('render', True)
+			if(source.get('type', None) == 'group'):
+				children = source.get('groupChildren', [])
+				groups[source['name']] = [child['name'] for child in children]
+				scenes[source['name']] = self._read_items(children, scenes, groups)
+		return items
+
+	def _on_event(self, event):
+		"""Called by the transport's receiver thread for every event"""
+		data = event.datain
+		if(event.name == 'SwitchScenes'):
+			with self.lock:
+				self.current_scene = data.get('scene-name', self.current_scene)
+
+		elif(event.name == 'SceneItemVisibilityChanged'):
+			with self.lock:
+				self.scenes.setdefault(data.get('scene-name'), {})[data.get('item-name')] = data.get('item-visible')
+
+		elif(event.name in self.structure_events):
+			self._refresh()
+
+	def _on_answer(self, request):
+		"""Called by the transport's receiver thread for every answered request"""
+		requests = getattr(request, 'requests', [request]) # the requests of an ExecuteBatch
+		for request in requests:
+			if(request.name == 'SetCurrentScene' and request.status):
+				with self.lock:
+					self.current_scene = request.dataout.get('scene-name', self.current_scene)
+
+	def _refresh(self):
+		"""Reads the scene list again without waiting for the answer, since this runs
+		on the receiver thread which reads that answer. Refreshes requested while one
+		is in flight are combined into a single one after it.
+		"""
+		with self.lock:
+			if(self.refreshing):
+				self.refresh_again = True
+				return
+			self.refreshing = True
+			self.refresh_again = False
+			transport = self.transport
+
+		try:
+			future = transport.send(obswebsocket.requests.GetSceneList())
+		except Exception as e:
+			self.log.warn("Could not refresh the OBS scene list: {}".format(e))
+			with self.lock:
+				self.refreshing = False
+			return
+		future.add_done_callback(self._on_refreshed)
+
+	def _on_refreshed(self, future):
+		try:
+			self._load(future.result())
+		except Exception as e:
+			self.log.warn("Could not refresh the OBS scene list: {}".format(e))
+
+		with self.lock:
+			self.refreshing = False
+			again = self.refresh_again
+		if(again):
+			self._refresh()
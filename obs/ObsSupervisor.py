@@ -0,0 +1,182 @@
+# Watches the connection to OBS and restores it when it's lost
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import Counter
+import obswebsocket, obswebsocket.requests
+
+class ObsSupervisor:
+	"""Runs on the action engine's loop and keeps the connection to OBS alive.
+
+	While connected it asks OBS for its version every heartbeat_interval seconds.
+	When that gets no answer, or the connection closes, it reconnects in the
+	background, waiting longer after every failed attempt (exponential backoff from
+	backoff_min up to backoff_max seconds, with random jitter so it doesn't retry
+	in lockstep with anything else).
+
+	Commands arriving while OBS is disconnected wait for up to queue_timeout seconds
+	for the connection to be restored, and are rejected after that.
+	"""
+
+	def __init__(self, obs_client, heartbeat_interval = 5.0, heartbeat_timeout = 3.0,
+			backoff_min = 0.5, backoff_max = 30.0, queue_timeout = 10.0):
+		self.log = logging.getLogger(__name__)
+		self.obs_client = obs_client
+		self.loop = obs_client.engine.loop
+		self.heartbeat_interval = heartbeat_interval
+		self.heartbeat_timeout = heartbeat_timeout
+		self.backoff_min = backoff_min
+		self.backoff_max = backoff_max
+		self.queue_timeout = queue_timeout
+		self.future = None
+
+		self.connected = True
+		self.outage_started = None
+		self.attempt = 0
+		self.stats = Counter()
+		self.last_outage = None
+		self.longest_outage = 0.0
+		self.total_outage = 0.0
+
+		# Created on the loop, when the supervisor starts
+		self.lost = None
+		self.restored = None
+		self.started = threading.Event()
+
+	def start(self):
+		"""Starts supervising. Call once the first connection is made"""
+		self.future = self.obs_client.engine.submit(self._run())
+		self.started.wait()
+
+	def stop(self):
+		if(self.future is not None):
+			self.future.cancel()
+			self.future = None
+
+	def connection_lost(self, reason):
+		"""Tells the supervisor the connection failed; safe to call from any thread"""
+		self._call_on_loop(self._mark_lost, reason)
+
+	def connection_restored(self):
+		"""Tells the supervisor the connection was restored by someone else, e.g. a
+		manual reconnect; safe to call from any thread
+		"""
+		self._call_on_loop(self._mark_restored)
+
+	def _call_on_loop(self, function, *args):
+		# On the loop itself, take effect right away so the caller sees the change
+		if(threading.current_thread() is self.obs_client.engine.thread):
+			function(*args)
+		else:
+			self.loop.call_soon_threadsafe(function, *args)
+
+	def backoff(self, attempt):
+		"""Seconds to wait after the given number of failed attempts: doubling each
+		time up to backoff_max, then picked randomly from the upper half of that
+		"""
+		delay = min(self.backoff_max, self.backoff_min * (2 ** attempt))
+		return random.uniform(delay / 2, delay)
+
+	async def wait_connected(self):
+		"""Waits until OBS is connected, for up to queue_timeout seconds. Returns
+		whether it is connected. Only call this from the engine's loop.
+		"""
+		if(self.connected):
+			return True
+		self.stats['queued'] += 1
+		try:
+			await asyncio.wait_for(self.restored.wait(), self.queue_timeout)
+			return True
+		except asyncio.TimeoutError:
+			self.stats['rejected'] += 1
+			return False
+
+	def status(self):
+		"""Describes the state of the connection, for the chat"""
+		if(self.connected):
+			return "Connected to OBS Websockets, reconnected {} times.".format(self.stats['reconnects'])
+		return "Disconnected from OBS Websockets for {:.0f} seconds, reconnect attempt #{}.".format(
+			time.time() - self.outage_started, self.attempt + 1)
+
+	def get_stats(self):
+		"""Returns counters for heartbeats, outages, reconnect attempts and queued or
+		rejected commands, and the last, longest and total outage in seconds
+		"""
+		stats = dict(self.stats)
+		stats['connected'] = self.connected
+		stats['last_outage'] = self.last_outage
+		stats['longest_outage'] = self.longest_outage
+		stats['total_outage'] = self.total_outage
+		if(not self.connected):
+			stats['current_outage'] = time.time() - self.outage_started
+		return stats
+
+	def _mark_lost(self, reason):
+		if(not self.connected):
+			return
+		self.log.error("Lost connection to OBS Websockets ({}), reconnecting in the background...".format(reason))
+		self.connected = False
+		self.outage_started = time.time()
+		self.attempt = 0
+		self.stats['outages'] += 1
+		if(self.lost is not None):
+			self.restored.clear()
+			self.lost.set()
+
+	def _mark_restored(self):
+		if(self.connected):
+			return
+		outage = time.time() - self.outage_started
+		self.log.info("...Reconnected to OBS Websockets after {:.1f} seconds.".format(outage))
+		self.connected = True
+		self.stats['reconnects'] += 1
+		self.last_outage = outage
+		self.longest_outage = max(self.longest_outage, outage)
+		self.total_outage += outage
+		if(self.lost is not None):
+			self.lost.clear()
+			self.restored.set()
+
+	async def _run(self):
+		self.lost = asyncio.Event()
+		self.restored = asyncio.Event()
+		if(self.connected):
+			self.restored.set()
+		else:
+			self.lost.set()
+		self.started.set()
+
+		while True:
+			if(self.connected):
+				try:
+					await asyncio.wait_for(self.lost.wait(), self.heartbeat_interval)
+				except asyncio.TimeoutError:
+					await self._heartbeat()
+			else:
+				await self._reconnect()
+
+	async def _heartbeat(self):
+		self.stats['heartbeats'] += 1
+		try:
+			await asyncio.wait_for(self.obs_client.call(obswebsocket.requests.GetVersion()), self.heartbeat_timeout)
+		except Exception as e:
+			self.stats['heartbeat_failures'] += 1
+			self._mark_lost("no answer to heartbeat: {}".format(str(e) or type(e).__name__))
+
+	async def _reconnect(self):
+		self.stats['reconnect_attempts'] += 1
+		self.log.warn("OBS reconnect attempt #{}".format(self.attempt + 1))
+		if(await self.loop.run_in_executor(None, self.obs_client._reconnect_once)):
+			self._mark_restored()
+			return
+
+		self.stats['failed_reconnects'] += 1
+		delay = self.backoff(self.attempt)
+		self.attempt += 1
+		# Stop waiting early if someone else reconnected meanwhile
+		try:
+			await asyncio.wait_for(self.restored.wait(), delay)
+		except asyncio.TimeoutError:
+			pass
@@ -0,0 +1,291 @@
+# Talks to OBS Websockets with many requests in flight at once
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError
+import websocket
+import obswebsocket.base_classes
+import obswebsocket.events
+from obswebsocket.exceptions import ConnectionFailure, MessageTimeout
+
+class ExecuteBatch(obswebsocket.base_classes.Baserequests):
+	"""Carries out several requests in a single pass through OBS (obs-websocket 4.9
+	or later). Once answered, each of the requests is filled in with its own result.
+	With abort_on_fail, OBS stops at the first request that fails and the requests
+	after it are left unanswered, with status None.
+	"""
+
+	def __init__(self, requests, abort_on_fail = False):
+		super().__init__()
+		self.name = 'ExecuteBatch'
+		self.requests = requests
+		self.dataout['requests'] = []
+		for index, request in enumerate(requests):
+			payload = request.data()
+			payload['message-id'] = str(index)
+			self.dataout['requests'].append(payload)
+		self.dataout['abortOnFail'] = abort_on_fail
+
+	def input(self, data):
+		super().input(data)
+		if(not self.status):
+			for request in self.requests:
+				request.status = False
+				request.datain = {'error': self.datain.get('error', "Batch failed")}
+			return
+		for index, result in enumerate(self.datain.get('results', [])):
+			result.setdefault('message-id', str(index))
+			self.requests[index].input(result)
+
+class ObsTransport:
+	"""A connection to OBS Websockets which, unlike obswebsocket.obsws, does not wait
+	for the answer to one request before sending the next. Each request is sent with
+	its own message-id and a receiver thread hands every answer to the request with
+	the same id as soon as it arrives, so an action sending several requests at once
+	waits about one round trip instead of one per request.
+
+	call(), register() and disconnect() work like they do on obsws, so this can be
+	used in its place; call_async() is the same as call() for coroutines, and
+	call_batch_async() sends several requests to be carried out together.
+	"""
+
+	def __init__(self, host, port, password, timeout = 60.0, connect_timeout = 5.0, on_close = None):
+		self.log = logging.getLogger(__name__)
+		self.host = host
+		self.port = port
+		self.password = password
+		self.timeout = timeout # Seconds to wait for an answer
+		self.connect_timeout = connect_timeout # Seconds to wait for each step of connecting
+		self.on_close = on_close # Called when the connection is lost, but not on disconnect()
+		self.ws = None
+		self.version = None # obs-websocket version, e.g. "4.9.1", once connected
+		self.thread = None
+		self.handlers = []
+		self.answer_handlers = []
+		self.pending = {} # message-id: (request, future)
+		self.message_ids = itertools.count(1)
+		self.pending_lock = threading.Lock()
+		self.send_lock = threading.Lock()
+
+	def connect(self):
+		"""Connects and authenticates, raising ConnectionFailure if either fails"""
+		ws = websocket.WebSocket()
+		try:
+			ws.connect("ws://{}:{}".format(self.host, self.port), timeout = self.connect_timeout)
+			self._auth(ws)
+			self.version = self._handshake_request(ws, {"request-type": "GetVersion"}).get('obs-websocket-version', None)
+			# The receiver thread waits for messages for as long as it takes
+			ws.settimeout(None)
+		except (OSError, websocket.WebSocketException) as e:
+			ws.close()
+			raise ConnectionFailure(str(e))
+		except ConnectionFailure:
+			ws.close()
+			raise
+
+		self.ws = ws
+		self.thread = threading.Thread(target = self._receive, args = (ws,))
+		self.thread.name = "ObsTransportThread"
+		self.thread.daemon = True
+		self.thread.start()
+
+	def _auth(self, ws):
+		"""Logs in with the password, if OBS Websockets requires one"""
+		result = self._handshake_request(ws, {"request-type": "GetAuthRequired"})
+		if(result.get('authRequired')):
+			secret = base64.b64encode(hashlib.sha256((self.password + result['salt']).encode('utf-8')).digest())
+			auth = base64.b64encode(hashlib.sha256(secret + result['challenge'].encode('utf-8')).digest()).decode('utf-8')
+			self._handshake_request(ws, {"request-type": "Authenticate", "auth": auth})
+
+	def _handshake_request(self, ws, payload):
+		"""Sends a request while connecting. This happens before the receiver thread
+		starts, so the answer is read directly, skipping any events sent meanwhile.
+		"""
+		message_id = str(next(self.message_ids))
+		payload["message-id"] = message_id
+		ws.send(json.dumps(payload))
+		while True:
+			result = json.loads(ws.recv())
+			if(result.get('message-id') == message_id):
+				break
+		if(result.get('status') != 'ok'):
+			raise ConnectionFailure(result.get('error', "{} failed while connecting to OBS Websockets".format(payload["request-type"])))
+		return result
+
+	def supports_batch(self):
+		"""Whether OBS understands ExecuteBatch, added in obs-websocket 4.9"""
+		try:
+			return tuple(int(part) for part in self.version.split('.')[:2]) >= (4, 9)
+		except (AttributeError, ValueError):
+			return False
+
+	def disconnect(self):
+		"""Closes the connection; requests still waiting for an answer fail"""
+		ws, self.ws = self.ws, None
+		if(ws is not None):
+			ws.close()
+		if(self.thread is not None and self.thread is not threading.current_thread()):
+			self.thread.join()
+		self.thread = None
+
+	def send(self, request):
+		"""Sends a request without waiting for the answer. Returns a
+		concurrent.futures.Future which resolves to the request, filled in with the
+		answer, or raises ConnectionFailure if the connection is lost first.
+		"""
+		return self._send(request)[1]
+
+	def _send(self, request):
+		"""Sends a request, returning its message-id and the future for its answer"""
+		ws = self.ws
+		if(ws is None):
+			raise ConnectionFailure("Not connected to OBS Websockets")
+
+		future = Future()
+		payload = request.data()
+		with self.pending_lock:
+			message_id = str(next(self.message_ids))
+			self.pending[message_id] = (request, future)
+		payload["message-id"] = message_id
+
+		try:
+			with self.send_lock:
+				ws.send(json.dumps(payload))
+		except (OSError, websocket.WebSocketException) as e:
+			self._abandon(message_id)
+			raise ConnectionFailure(str(e))
+		return message_id, future
+
+	def _abandon(self, message_id):
+		"""Stops waiting for an answer, so a request OBS never answers is not kept forever"""
+		with self.pending_lock:
+			self.pending.pop(message_id, None)
+
+	def call(self, request):
+		"""Sends a request and waits for its answer, like obsws.call"""
+		message_id, future = self._send(request)
+		try:
+			return future.result(self.timeout)
+		except TimeoutError:
+			self._abandon(message_id)
+			future.cancel()
+			raise MessageTimeout("No answer for {} request".format(request.name))
+
+	async def call_async(self, request):
+		"""Sends a request and waits for its answer without blocking the loop"""
+		message_id, future = self._send(request)
+		try:
+			return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+		except asyncio.TimeoutError:
+			self._abandon(message_id)
+			raise MessageTimeout("No answer for {} request".format(request.name))
+
+	async def call_batch_async(self, requests, abort_on_fail = False):
+		"""Sends several requests to be carried out together and waits for all the
+		answers, returning the requests filled in. OBS carries out a batch in a single
+		pass, so for example hiding one source and showing another never leaves a
+		frame with both or neither shown. Older versions of OBS Websockets get the
+		requests pipelined instead, which takes the same single round trip but can
+		neither guarantee that nor abort on failure.
+		"""
+		if(not requests):
+			return []
+		if(self.supports_batch()):
+			await self.call_async(ExecuteBatch(requests, abort_on_fail))
+			return requests
+		return list(await asyncio.gather(*[self.call_async(request) for request in requests]))
+
+	def register(self, function, event = None):
+		"""Calls function with every event of the given obswebsocket.events class,
+		or with every event if no class is given. Functions are called on the
+		receiver thread, so they should return quickly.
+		"""
+		self.handlers.append((function, event))
+
+	def watch_answers(self, function):
+		"""Calls function with every request once it is answered, on the receiver
+		thread, before the answer is handed to whoever sent the request. Used to keep
+		a mirror of OBS up to date with the changes the bot itself makes.
+		"""
+		self.answer_handlers.append(function)
+
+	def unregister(self, function, event = None):
+		self.handlers = [(f, e) for (f, e) in self.handlers if not (f == function and (event is None or e == event))]
+
+	def _receive(self, ws):
+		"""Reads answers and events until the connection closes"""
+		while True:
+			try:
+				message = ws.recv()
+			except (OSError, websocket.WebSocketException) as e:
+				if(self.ws is ws):
+					self.log.error("Lost connection to OBS Websockets: {}".format(e))
+				break
+
+			# recv() returns an empty string for empty frames such as pings
+			if(not message):
+				continue
+
+			try:
+				data = json.loads(message)
+			except ValueError:
+				self.log.warn("Invalid message from OBS Websockets: {}".format(message))
+				continue
+
+			if('message-id' in data):
+				self._answer(data)
+			elif('update-type' in data):
+				self._trigger(data)
+			else:
+				self.log.warn("Unknown message from OBS Websockets: {}".format(data))
+
+		# Nothing more will be answered on this connection
+		with self.pending_lock:
+			lost = self.ws is ws
+			if(lost):
+				self.ws = None
+			pending, self.pending = self.pending, {}
+		for request, future in pending.values():
+			if(future.set_running_or_notify_cancel()):
+				future.set_exception(ConnectionFailure("Lost connection before {} was answered".format(request.name)))
+
+		if(lost and self.on_close is not None):
+			self.on_close()
+
+	def _answer(self, data):
+		with self.pending_lock:
+			entry = self.pending.pop(data['message-id'], None)
+		if(entry is None):
+			self.log.debug("Answer to unknown or abandoned request {}".format(data['message-id']))
+			return
+
+		request, future = entry
+		if(future.set_running_or_notify_cancel()):
+			request.input(data)
+			for function in self.answer_handlers:
+				try:
+					function(request)
+				except Exception as e:
+					self.log.error("Error handling OBS answer to {}: {}".format(request.name, e))
+			future.set_result(request)
+
+	def _trigger(self, data):
+		# Events newer than obs-websocket-py still reach handlers registered for all events
+		event_class = getattr(obswebsocket.events, data['update-type'], None)
+		if(event_class is None):
+			event = obswebsocket.base_classes.Baseevents()
+			event.name = data['update-type']
+		else:
+			event = event_class()
+		event.input(data)
+
+		for function, trigger in self.handlers:
+			if(trigger is None or isinstance(event, trigger)):
+				try:
+					function(event)
+				except Exception as e:
+					self.log.error("Error handling OBS event {}: {}".format(event.name, e))
@@ -0,0 +1,139 @@
+# Counts the votes for commands which need several viewers to agree
+import logging
+import threading
+import time
+from collections import Counter, deque
+from obs.Permission import Permission
+
+class _Ballot:
+	"""The live votes for one command"""
+
+	__slots__ = ('voters', 'order', 'tally')
+
+	def __init__(self):
+		self.voters = {} # user name: (time, weight) of their latest vote
+		self.order = deque() # (time, user name) of every vote, oldest first
+		self.tally = 0.0
+
+class VoteEngine:
+	"""Keeps the votes for every command, shared by all the actions.
+
+	A vote only counts for window seconds (or the command's own window, see
+	set_windows), after which it expires by itself, so votes from long ago don't add
+	up with new ones. A viewer voting again renews their vote rather than adding a
+	second one. Each vote is weighted by the viewer's permission level, 1 unless
+	configured otherwise, and the tally is kept up to date as votes come and go, so
+	checking it doesn't count the votes again.
+
+	snapshot() returns the current votes of every command, e.g. for an overlay.
+	"""
+
+	def __init__(self, window = 300.0, weights = None):
+		self.log = logging.getLogger(__name__)
+		self.window = window
+		self.windows = {} # command name: window, where it differs from the default
+		self.weights = dict(weights or {}) # Permission: weight
+		self.ballots = {} # command name: _Ballot
+		self.lock = threading.Lock()
+		self.stats = Counter()
+
+	def set_windows(self, windows):
+		"""Sets how long votes count for each command, replacing the previous windows.
+		windows maps command names to seconds, or None for the default
+		"""
+		windows = dict((command_name, window) for command_name, window in windows.items() if window is not None)
+		with self.lock:
+			self.windows = windows
+
+	def weight(self, permission):
+		return self.weights.get(permission, 1.0)
+
+	def vote(self, command_name, user_name, permission = Permission.EVERYONE, now = None):
+		"""Adds or renews a viewer's vote for a command, returning the command's tally"""
+		now = time.monotonic() if now is None else now
+		weight = self.weight(permission)
+		with self.lock:
+			ballot = self.ballots.get(command_name, None)
+			if(ballot is not None):
+				self._expire(command_name, ballot, now)
+			if(command_name not in self.ballots):
+				ballot = self.ballots[command_name] = _Ballot()
+
+			previous = ballot.voters.get(user_name, None)
+			if(previous is not None):
+				ballot.tally -= previous[1]
+				self.stats['renewed'] += 1
+			ballot.voters[user_name] = (now, weight)
+			ballot.order.append((now, user_name))
+			ballot.tally += weight
+			self.stats['votes'] += 1
+			return ballot.tally
+
+	def tally(self, command_name, now = None):
+		"""Returns the weighted votes a command has right now"""
+		now = time.monotonic() if now is None else now
+		with self.lock:
+			ballot = self.ballots.get(command_name, None)
+			if(ballot is None):
+				return 0.0
+			self._expire(command_name, ballot, now)
+			return ballot.tally
+
+	def clear(self, command_name):
+		"""Forgets the votes for a command, e.g. once it has enough to run"""
+		with self.lock:
+			if(self.ballots.pop(command_name, None) is not None):
+				self.stats['passed'] += 1
+
+	def forget(self, command_name):
+		"""Drops the votes for a command without counting it as passed, e.g. once the
+		command is removed
+		"""
+		with self.lock:
+			self.ballots.pop(command_name, None)
+
+	def snapshot(self, now = None):
+		"""Returns the votes of every command with any: the weighted tally, the number
+		of voters, and the seconds until the next vote expires
+		"""
+		now = time.monotonic() if now is None else now
+		snapshot = {}
+		with self.lock:
+			for command_name, ballot in list(self.ballots.items()):
+				self._expire(command_name, ballot, now)
+				if(command_name not in self.ballots):
+					continue
+				snapshot[command_name] = {
+					'votes': ballot.tally,
+					'voters': len(ballot.voters),
+					'expires_in': ballot.order[0][0] + self.windows.get(command_name, self.window) - now,
+				}
+		return snapshot
+
+	def get_stats(self):
+		"""Returns counters for votes cast, renewed and expired, and commands passed"""
+		with self.lock:
+			stats = dict(self.stats)
+			stats['ballots'] = len(self.ballots)
+		return stats
+
+	def _expire(self, command_name, ballot, now):
+		"""Drops the votes older than the command's window. Only the oldest votes are
+		looked at, so this costs nothing while no vote expires. Call with the lock held.
+		"""
+		cutoff = now - self.windows.get(command_name, self.window)
+		order = ballot.order
+		while(order):
+			cast, user_name = order[0]
+			latest = ballot.voters.get(user_name, None)
+			if(latest is not None and latest[0] == cast):
+				# Still the viewer's latest vote
+				if(cast > cutoff):
+					break
+				del ballot.voters[user_name]
+				ballot.tally -= latest[1]
+				self.stats['expired'] += 1
+			order.popleft()
+
+		if(not ballot.voters):
+			del self.ballots[command_name]
@@ -1,10 +1,15 @@
 import obswebsocket, obswebsocket.requests
 import logging
+import math
 import time
 from obs.Permission import Permission
 
 class Action:
 
+	# Whether the twitch bot's cooldown starts after this action succeeds.
+	# Actions which only talk in chat can be used again straight away.
+	cooldown = True
+
 	def __init__(self, obs_client, command_name, aliases, description, permission, min_votes, args):
 		"""Initializes this class
 		
@@ -24,14 +29,40 @@ class Action:
 		self.description = description
 		self.permission = permission
 		self.min_votes = min_votes
-		self.votes = set()
 
-	def execute(self, user):
+	async def execute(self, user):
+		"""Coroutine run by the action engine once accepts() allowed the command and
+		its resources are free. Returns True if the action succeeded.
+		Wait with 'await asyncio.sleep()' and call OBS with 'await self.obs_client.call()'
+		so other commands can run in the meantime.
+		"""
 		raise NotImplementedError("The action isn't defined!")
 
+	def accepts(self, user):
+		"""Returns whether the user may run the command now, checking their permission
+		and adding their vote. The ObsClient calls this before execute(), so a refused
+		command is reported as failed straight away, without waiting for its resources
+		"""
+		return self._has_permission(user) and self._has_enough_votes(user)
+
 	def _init_args(self, args):
 		raise NotImplementedError("The action isn't defined!")
 
+	def resources(self):
+		"""Returns the set of OBS resources this action touches, such as
+		("source", name) or ("scene",). Commands sharing a resource never run at
+		the same time. Override this in actions that change OBS.
+		"""
+		return set()
+
+	def batch_requests(self):
+		"""Returns the list of OBS requests which make up this action, if it is a
+		single change that can be sent in a batch together with other changes, or
+		None if it isn't. Used by actions made of other actions, such as Chain and
+		Toggle, which check permission and votes themselves.
+		"""
+		return None
+
 	def _has_enough_votes(self, user):
 
 		# short-circuit the whole check if the user is the broadcaster or mod
@@ -39,16 +70,21 @@ class Action:
 			self.log.debug("Command {}: Skipping votes, {} is a moderator or broadcaster".format(self.command_name, user['name']))
 			return True
 
-		# otherwise, add the user to the vote list and determine if enough votes
-		self.votes.add(user['name'])
-		votes_received = len(self.votes)
+		# or if the command doesn't need any votes
+		if(self.min_votes <= 0):
+			return True
+
+		# otherwise, add the user's vote and determine if enough votes, see VoteEngine
+		votes = self.obs_client.votes
+		votes_received = votes.vote(self.command_name, user['name'], self._get_user_permission(user))
 		if(not votes_received >= self.min_votes):
 			self.log.debug("Command {}: Insufficient votes, {} received of {} required.".format(self.command_name, votes_received, self.min_votes))
-			remaining_votes = self.min_votes - votes_received
-			self._twitch_say("{} votes to {} Will {} more join them? (!{})".format(user['name'], self.description, remaining_votes, self.command_name))
+			remaining_votes = math.ceil(self.min_votes - votes_received)
+			self._twitch_say("{} votes to {} Will {} more join them? (!{})".format(user['name'], self.description, remaining_votes, self.command_name),
+				supersede = "votes:" + self.command_name)
 			return False
 		else:
-			self.votes = set()
+			votes.clear(self.command_name)
 			self.log.debug("Command {}: All votes received".format(self.command_name))
 			return True
 
@@ -58,24 +94,30 @@ class Action:
 		See the Permission class; MODERATOR > SUBSCRIBER > FOLLOWER > EVERYONE
 		"""
 		# First determine the user's permision level
-		if(user['broadcaster']):
-			user_permission = Permission.BROADCASTER
-		elif(user['moderator']):
-			user_permission = Permission.MODERATOR
-		elif(user['subscriber']):
-			user_permission = Permission.SUBSCRIBER
-		elif(user['follower']):
-			user_permission = Permission.FOLLOWER
-		else:
-			user_permission = Permission.EVERYONE
+		user_permission = self._get_user_permission(user)
 		
 		result = user_permission >= self.permission
 		self.log.debug("User '{}' has permission {} and required permission is {}. Operation Allowed: {}".format(user['name'], user_permission, self.permission, result))
 
 		return result
 
-	def _twitch_say(self, message):
-		self.obs_client.twitch_bot.twitch_say(message)
+	def _get_user_permission(self, user):
+		if(user['broadcaster']):
+			return Permission.BROADCASTER
+		elif(user['moderator']):
+			return Permission.MODERATOR
+		elif(user['subscriber']):
+			return Permission.SUBSCRIBER
+		elif(user['follower']):
+			return Permission.FOLLOWER
+		else:
+			return Permission.EVERYONE
+
+	def _twitch_say(self, message, supersede = None):
+		"""Says message in chat. A message with a supersede key replaces the previous one
+		with the same key if that one wasn't sent yet, e.g. an outdated vote count
+		"""
+		self.obs_client.twitch_bot.twitch_say(message, supersede = supersede)
 
 	def _twitch_done(self):
 		self.obs_client.twitch_bot.twitch_done()
@@ -84,7 +126,7 @@ class Action:
 		self.obs_client.twitch_bot.twitch_failed()
 
 	def _twitch_sleep(self, duration):
-		self.obs_client.twitch_bot.twitch_sleep()
+		self.obs_client.twitch_bot.twitch_sleep(duration)
 
 	def _twitch_shutdown(self):
 		self.obs_client.twitch_bot.twitch_shutdown()
\ No newline at end of file
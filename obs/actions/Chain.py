@@ -14,29 +14,44 @@ class Chain(Action):
 		self.log = logging.getLogger(__name__)
 		self._init_args(args)
 
-	def execute(self, user):
-		"""Shows a scene item, such as an image or video, and then hides it after
-		a specified duration
+	async def execute(self, user):
+		"""Executes each command in the list, in order
 		"""
 
-		# Check user permissions and votes
-		if(not (
-			self._has_permission(user) 
-			and self._has_enough_votes(user) 
-			)
-		):
-			return self._twitch_failed()
-		
 		# finally execute the commands in the list, in order.
 		# Fail the entire chain if one link fails.
+		# Consecutive links which are single changes, such as showing or hiding a
+		# source without a duration, are sent to OBS together in one batch.
+		batch = []
 		for command_obj in self.command_objs:
-			if(not command_obj.execute(user)):
-				self._twitch_failed()
+			requests = command_obj.batch_requests()
+			if(requests is not None):
+				batch += requests
+				continue
+
+			if(not await self._send_batch(batch)):
+				return False
+			batch = []
+			if(not await self.obs_client.engine.run(command_obj, user)):
 				return False
 
-		self._twitch_done()
+		return await self._send_batch(batch)
+
+	async def _send_batch(self, batch):
+		"""Sends a batch of changes, stopping at the first one which fails"""
+		for res in await self.obs_client.call_batch(batch, abort_on_fail = True):
+			if(not res.status):
+				self.log.warn("Command {}: Could not {}! Error: {}".format(self.command_name, res.name, res.datain.get('error', None)))
+				return False
 		return True
 
+	def resources(self):
+		"""The chain holds everything its links touch, for the entire chain"""
+		resources = set()
+		for command_obj in self.command_objs:
+			resources |= command_obj.resources()
+		return resources
+
 	def _init_args(self, args):
 		"""This validates the arguments are valid for this instance, 
 		and raises a ValueError if they aren't.
@@ -7,6 +7,8 @@ from itertools import groupby
 
 class Help(Action):
 
+	cooldown = False # other commands can execute right after help
+
 	def __init__(self, obs_client, command_name, aliases, description, permission, min_votes, args):
 		"""Initializes this class, see Action.py
 		"""
@@ -14,7 +16,11 @@ class Help(Action):
 		self.log = logging.getLogger(__name__)
 		self._init_args(args)
 
-	def execute(self, user):
+	def accepts(self, user):
+		"""Anyone can ask for help"""
+		return True
+
+	async def execute(self, user):
 		"""Shows all the commands available
 		"""
 
@@ -57,7 +63,6 @@ class Help(Action):
 				help_strs.append(help_str)
 			self._twitch_say(help_strs)
 
-		self._twitch_failed() # force reset the queue so other commands can execute
 		return True
 
 	def _init_args(self, args):
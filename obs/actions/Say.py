@@ -7,6 +7,8 @@ import random
 
 class Say(Action):
 
+	cooldown = False # other commands can execute right after saying something
+
 	def __init__(self, obs_client, command_name, aliases, description, permission, min_votes, args):
 		"""Initializes this class, see Action.py
 		"""
@@ -14,18 +16,9 @@ class Say(Action):
 		self.log = logging.getLogger(__name__)
 		self._init_args(args)
 
-	def execute(self, user):
+	async def execute(self, user):
 		"""Says specified text in chat
 		"""
-		# Check user permissions and votes
-		if(not (
-			self._has_permission(user) 
-			and self._has_enough_votes(user) 
-			)
-		):
-			self._twitch_failed()
-			return False
-		
 		# finally say the messages in order, no cooldown
 		if self.random == True:
 			if(len(self.messages) == 0):
@@ -39,7 +32,6 @@ class Say(Action):
 		else:
 			self._twitch_say(self.messages)
 
-		self._twitch_failed()
 		return True
 
 	def _init_args(self, args):
@@ -1,4 +1,5 @@
 import obswebsocket, obswebsocket.requests
+import asyncio
 import logging
 import time
 from obs.actions.Action import Action
@@ -11,51 +12,54 @@ class ShowScene(Action):
 		self.log = logging.getLogger(__name__)
 		self._init_args(args)
 
-	def execute(self, user):
+	async def execute(self, user):
 		"""Permanently switches to a specified scene
 		"""
-		# Check user permissions and votes
-		if(not (
-			self._has_permission(user) 
-			and self._has_enough_votes(user) 
-			)
-		):
-			self._twitch_failed()
-			return False
-		
 		# finally execute the command
 		# if a duration was provided, then switch back to the originating scene after duration
 		# otherwise just permanently switch to the scene
 		if(self.duration is not None):
-			starting_scene = self.obs_client.client.call(obswebsocket.requests.GetCurrentScene()).getName()
-
-			# switch to the desired scene
-			res = self.obs_client.client.call(obswebsocket.requests.SetCurrentScene(self.scene))
+			# switch to the desired scene, remembering the starting scene. It's known
+			# locally unless the OBS state couldn't be read, in which case it's read in
+			# the same round trip; OBS answers requests in order, so it's read first
+			starting_scene = self.obs_client.state.get_current_scene()
+			if(starting_scene is None):
+				current, res = await asyncio.gather(
+					self.obs_client.call(obswebsocket.requests.GetCurrentScene()),
+					self.obs_client.call(obswebsocket.requests.SetCurrentScene(self.scene)))
+				starting_scene = current.getName()
+			else:
+				res = await self.obs_client.call(obswebsocket.requests.SetCurrentScene(self.scene))
 			if(res.status == False):
 				self.log.warn("Could not set scene! Error: {}".format(res.datain['error']))
-				self._twitch_failed()
 				return False
 
-			# wait the specified duration
-			time.sleep(self.duration)
+			# wait the specified duration without blocking other commands
+			await asyncio.sleep(self.duration)
 
 			# switch back to the starting scene
-			res = self.obs_client.client.call(obswebsocket.requests.SetCurrentScene(starting_scene))
+			res = await self.obs_client.call(obswebsocket.requests.SetCurrentScene(starting_scene))
 			if(res.status == False):
 				self.log.warn("Could not set scene! Error: {}".format(res.datain['error']))
-				self._twitch_failed()
 				return False
 
 		else:
-			res = self.obs_client.client.call(obswebsocket.requests.SetCurrentScene(self.scene))
+			res = await self.obs_client.call(obswebsocket.requests.SetCurrentScene(self.scene))
 			if(res.status == False):
 				self.log.warn("Could not set scene! Error: {}".format(res.datain['error']))
-				self._twitch_failed()
 				return False
 
-		self._twitch_done()
 		return True
 
+	def batch_requests(self):
+		"""Switching scenes permanently is a single change"""
+		if(self.duration is not None):
+			return None
+		return [obswebsocket.requests.SetCurrentScene(self.scene)]
+
+	def resources(self):
+		return set([("scene",)])
+
 	def _init_args(self, args):
 		"""This validates the arguments are valid for this instance, 
 		and raises a ValueError if they aren't.
@@ -1,4 +1,5 @@
 import obswebsocket, obswebsocket.requests
+import asyncio
 import logging
 import time
 import random
@@ -13,52 +14,68 @@ class ShowSource(Action):
 		self.log = logging.getLogger(__name__)
 		self._init_args(args)
 
-	def execute(self, user):
+	async def execute(self, user):
 		"""Shows a scene item, such as an image or video, and then hides it after
 		a specified duration
 		"""
 
-		# Check user permissions and votes
-		if(not (
-			self._has_permission(user) 
-			and self._has_enough_votes(user) 
-			)
-		):
-			self._twitch_failed()
-			return False
-		
 		# finally execute the command
 		
 		# get the random choice if applicable
-		if(len(self.pickable_items) == 0):
-			self.pickable_items = self.picked_items
-			self.picked_items = []
-
-		choice = self.pickable_items.pop(random.randrange(len(self.pickable_items)))
-		self.picked_items.append(choice)
+		choice = self._pick()
 
 		# show the scene
-		res = self.obs_client.client.call(obswebsocket.requests.SetSceneItemRender(choice, True, self.scene))
+		res = await self.obs_client.call(obswebsocket.requests.SetSceneItemRender(choice, True, self.scene))
 		if(res.status == False):
 			self.log.warn("Could not show scene item {}! Error: {}".format(choice, res.datain['error']))
-			self._twitch_failed()
 			return False
 
-		# if a duration was specified then sleep and then hide the scene
+		# if a duration was specified then wait and then hide the scene
 		if(self.duration is not None):
-			# wait the specified duration
-			time.sleep(self.duration)
+			# wait the specified duration without blocking other commands
+			await asyncio.sleep(self.duration)
 
 			# hide the scene again
-			res = self.obs_client.client.call(obswebsocket.requests.SetSceneItemRender(choice, False, self.scene))
+			res = await self.obs_client.call(obswebsocket.requests.SetSceneItemRender(choice, False, self.scene))
 			if(res.status == False):
 				self.log.warn("Could not hide scene item {}! Error: {}".format(choice, res.datain['error']))
-				self._twitch_failed()
 				return False
 
-		self._twitch_done()
 		return True
 
+	def batch_requests(self):
+		"""Showing a source permanently is a single change"""
+		if(self.duration is not None):
+			return None
+		return [obswebsocket.requests.SetSceneItemRender(self._pick(), True, self.scene)]
+
+	def _pick(self):
+		"""Picks a random item, not picking any item twice until all were picked"""
+		self._sync_group()
+		if(len(self.pickable_items) == 0):
+			self.pickable_items = self.picked_items
+			self.picked_items = []
+
+		choice = self.pickable_items.pop(random.randrange(len(self.pickable_items)))
+		self.picked_items.append(choice)
+		return choice
+
+	def _sync_group(self):
+		"""Follows items being added to or removed from the group in OBS"""
+		if(not self.pick_from_group):
+			return
+		items = self.obs_client.state.group_items(self.source)
+		if(not items or set(items) == set(self.pickable_items + self.picked_items)):
+			return
+		self.log.debug("Command {}: Group items changed to: {}".format(self.command_name, items))
+		self.picked_items = [item for item in self.picked_items if item in items]
+		self.pickable_items = [item for item in items if item not in self.picked_items]
+
+	def resources(self):
+		"""Any of the items that could be picked"""
+		self._sync_group()
+		return set(("source", item) for item in self.pickable_items + self.picked_items)
+
 	def _init_args(self, args):
 		"""This validates the arguments are valid for this instance, 
 		and raises a ValueError if they aren't.
@@ -84,21 +101,25 @@ class ShowSource(Action):
 
 		# If picking from the group (rather than hiding/showing the entire group contents), 
 		# then try to get the items in the group and store them.
+		self.picked_items = []
 		if(isinstance(self.source, list)):
-			self.pickable_items = self.source
+			self.pickable_items = list(self.source)
 			return
 
 		try:
-			self.picked_items = []
 			self.pickable_items = [self.source]
 			if(self.pick_from_group):
 				self.log.debug("Command {}: Group picking enabled".format(self.command_name))
-				source_settings = self.obs_client.client.call(obswebsocket.requests.GetSourceSettings(self.source))
-				if(source_settings):
-					self.log.debug("Command {}: Found source settings on source {}: {}".format(self.command_name, self.source, source_settings))
-					items = source_settings.getSourcesettings().get('items', None)
-					if(items and len(items)>0): #If this is incorrect, restart OBS
-						self.pickable_items = list(map(lambda item: item.get('name'), items)) 
+				items = self.obs_client.state.group_items(self.source)
+				if(items):
+					self.pickable_items = items
+				else:
+					source_settings = self.obs_client.client.call(obswebsocket.requests.GetSourceSettings(self.source))
+					if(source_settings):
+						self.log.debug("Command {}: Found source settings on source {}: {}".format(self.command_name, self.source, source_settings))
+						items = source_settings.getSourcesettings().get('items', None)
+						if(items and len(items)>0): #If this is incorrect, restart OBS
+							self.pickable_items = list(map(lambda item: item.get('name'), items)) 
 			self.log.debug("Command {}: Pickable items are: {}".format(self.command_name, self.pickable_items))
 		except Exception as e:
 			raise ValueError("Command {}: OBS/Config Error, specified source may not exist in OBS. Error: {}".format(self.command_name, e))
@@ -1,4 +1,5 @@
 import obswebsocket, obswebsocket.requests
+import asyncio
 import logging
 import time
 import random
@@ -16,39 +17,40 @@ class Toggle(Action):
 		self.log = logging.getLogger(__name__)
 		self._init_args(args)
 
-	def execute(self, user):
+	async def execute(self, user):
 		"""Shows a scene item, such as an image or video, and then hides it after
 		a specified duration
 		"""
 
-		# Check user permissions and votes
-		if(not (
-			self._has_permission(user) 
-			and self._has_enough_votes(user) 
-			)
-		):
-			self._twitch_failed()
-			return False
-		
-		# finally execute the command
-		if(not self.toggle_off_obj2.execute(user)):
-			return False
-		if(not self.toggle_on_obj1.execute(user)):
+		# finally execute the command, sending both halves of each swap in one batch
+		# so they show up on screen at the same time
+		if(not await self._swap(self.toggle_off_obj2, self.toggle_on_obj1)):
 			return False
 
-		# if a duration was specified then sleep and then hide the scene
+		# if a duration was specified then wait and then hide the scene
 		if(self.duration is not None):
-			# wait the specified duration
-			time.sleep(self.duration)
+			# wait the specified duration without blocking other commands
+			await asyncio.sleep(self.duration)
 
-			if(not self.toggle_on_obj2.execute(user)):
-				return False
-			if(not self.toggle_off_obj1.execute(user)):
+			if(not await self._swap(self.toggle_on_obj2, self.toggle_off_obj1)):
 				return False
 
-		self._twitch_done()
 		return True
 
+	async def _swap(self, hide_obj, show_obj):
+		results = await self.obs_client.call_batch(hide_obj.batch_requests() + show_obj.batch_requests())
+		for res in results:
+			if(not res.status):
+				self.log.warn("Could not toggle scene item {}! Error: {}".format(res.dataout['source'], res.datain.get('error', None)))
+				return False
+		return True
+
+	def resources(self):
+		return (self.toggle_on_obj1.resources() 
+			| self.toggle_off_obj1.resources()
+			| self.toggle_on_obj2.resources()
+			| self.toggle_off_obj2.resources())
+
 	def _init_args(self, args):
 		"""This validates the arguments are valid for this instance, 
 		and raises a ValueError if they aren't.
@@ -1,4 +1,5 @@
 import obswebsocket, obswebsocket.requests
+import asyncio
 import logging
 import time
 from obs.actions.Action import Action
@@ -6,6 +7,8 @@ from obs.Permission import Permission
 
 class Wait(Action):
 
+	cooldown = False
+
 	def __init__(self, obs_client, command_name, aliases, description, permission, min_votes, args):
 		"""Initializes this class, see Action.py
 		"""
@@ -13,21 +16,11 @@ class Wait(Action):
 		self.log = logging.getLogger(__name__)
 		self._init_args(args)
 
-	def execute(self, user):
+	async def execute(self, user):
 		"""Waits a specified duration
 		"""
-		# Check user permissions and votes
-		if(not (
-			self._has_permission(user) 
-			and self._has_enough_votes(user) 
-			)
-		):
-			self._twitch_failed()
-			return False
-		
-		# finally wait the specified duration in seconds
-		time.sleep(self.duration)
-		self._twitch_failed()
+		# finally wait the specified duration in seconds, without blocking other commands
+		await asyncio.sleep(self.duration)
 
 		return True
 
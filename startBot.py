@@ -1,10 +1,14 @@
 from obs.ObsClient import ObsClient
+from obs.ConfigWatcher import ConfigWatcher
+from obs.Permission import Permission
 from twitch.TwitchBot import TwitchBot
 import json
 import logging
 import logging.config
 
 class ObsCommandBot(TwitchBot):
+		builtin_commands = set(['obsstatus', 'reset', 'reconnect', 'recover'])
+
 		def __init__(self, obs_config, twitch_config):
 				super().__init__(**twitch_config)
 				self.log = logging.getLogger(__name__)
@@ -32,12 +36,36 @@ class ObsCommandBot(TwitchBot):
 				else:
 						self.obs_client.execute(cmd["user"], cmd["action"])
 
+		def is_known_command(self, action):
+				"""Chat messages for anything else are dropped before doing any work on them"""
+				return action.lower() in self.builtin_commands or self.obs_client.is_known_command(action)
+
+		def canonical_command(self, action):
+				"""Aliases share the rate limits of the command they stand for"""
+				command = self.obs_client.dispatch.lookup(action)
+				return command.command_name.lower() if command is not None else action.lower()
+
+		def follower_status_required(self, action):
+				"""Only commands restricted to followers need the follower status, and commands
+				needing votes when a follower's vote weighs differently (see obs.vote_weights).
+				Built-in commands are broadcaster-only and unknown commands fail anyway.
+				"""
+				command = self.obs_client.dispatch.lookup(action)
+				if(command is None):
+					return False
+				if(command.permission == Permission.FOLLOWER):
+					return True
+				votes = self.obs_client.votes
+				return command.min_votes > 0 and votes.weight(Permission.FOLLOWER) != votes.weight(Permission.EVERYONE)
+
 		def _report_status(self, cmd):
 			obs_status = self.obs_client.getVersion()
 			if "Exception" in obs_status:
-				obs_message = obs_status
+				obs_message = "{} {}".format(obs_status, self.obs_client.supervisor.status())
 			else:
-				obs_message = "Connected to OBS Websockets version {}.".format(obs_status)
+				obs_message = "Connected to OBS Websockets version {}, reconnected {} times.".format(
+					obs_status,
+					self.obs_client.supervisor.get_stats().get('reconnects', 0))
 
 			self.twitch_say("Twitch Bot is up and running. {}".format(
 				obs_message
@@ -84,6 +112,15 @@ def main():
 
 	# Initiate connection and call the commands
 	bot = ObsCommandBot(obs_config, twitch_config)
+
+	# Reload the commands whenever config.json is saved
+	reload_interval = obs_config.get('reload_interval', 1.0)
+	if(reload_interval):
+		watcher = ConfigWatcher('config.json',
+			lambda data: bot.obs_client.reload_commands(data.get('obs', {})),
+			reload_interval)
+		watcher.start()
+
 	bot.start()
 	bot.run_forever()
 
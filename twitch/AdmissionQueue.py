@@ -0,0 +1,404 @@
+from collections import Counter
+from queue import Empty
+import heapq
+import itertools
+import threading
+import time
+
+
+class _Entry(object):
+    """A command waiting in the admission queue."""
+
+    __slots__ = ("priority", "seq", "cmd", "key", "gated",
+                 "enqueued", "removed")
+
+    def __init__(self, priority, seq, cmd, key, gated, enqueued):
+        self.priority = priority
+        self.seq      = seq
+        self.cmd      = cmd
+        self.key      = key
+        self.gated    = gated
+        self.enqueued = enqueued
+        self.removed  = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionQueue(object):
+    """
+    Bounded priority queue of commands waiting to be run.
+
+    Sits between the Twitch bot core, which puts commands in,
+    and the Twitch bot, which gets them out, in place of a
+    plain Queue. Commands come out highest priority first,
+    and in the order they were put in within a priority:
+
+    0. the broadcaster and moderators
+    1. subscribers
+    2. everyone else
+
+    Commands can be given a fixed priority of their own in
+    priorities, which applies whoever sends them.
+
+    The queue also holds the cooldown timer. While it runs,
+    gated commands wait in the queue instead of being
+    dropped; ungated ones (e.g. commands which bypass the
+    cooldown) come out right away. Getting a gated command
+    restarts the cooldown timer for timeout seconds, until
+    the bot reports the command done or failed.
+
+    To keep the queue short when chat is busy:
+
+    * A command which the same viewer already has waiting,
+      with the same name and arguments, is not queued again;
+      the waiting one takes the higher priority of the two
+      instead. Commands from different viewers are never
+      merged, since each one may be a vote.
+    * Once max_depth commands wait, a new command replaces
+      the newest waiting command of lower priority, or is
+      rejected if there is none.
+    * Once shed_depth commands wait, new commands of the
+      lowest priority are rejected.
+    * Commands which waited longer than max_wait seconds
+      are dropped instead of run late.
+
+    Internal commands, which have no user (e.g. "shutdown"),
+    are always queued, ahead of everything else.
+
+    Attributes
+    ----------
+    timeout : float
+        How long the cooldown runs after a gated command is
+        taken out, or None for no cooldown.
+    max_depth : int
+        Most commands which can wait at once.
+    shed_depth : int
+        Depth from which lowest priority commands are rejected,
+        or None to only enforce max_depth.
+    max_wait : float
+        Seconds a command may wait before it is dropped,
+        or None to wait for as long as it takes.
+    coalesce : bool
+        Whether a viewer's duplicate commands are merged.
+    priorities : dict
+        Fixed priority for specific commands, by name.
+    stats : collections.Counter
+        Counters for commands admitted, coalesced, rejected,
+        shed, replaced, expired and released, and their wait.
+
+    Methods
+    -------
+    from_config(config : dict, timeout : float) -> AdmissionQueue
+        Creates a queue from the admission configuration.
+    put(cmd : TwitchCommand, key : str, gated : bool) -> bool
+        Queues a command. Returns whether it was admitted.
+    get(block : bool, timeout : float) -> TwitchCommand
+        Takes out the next command, like Queue.get.
+    set_cooldown(duration : float)
+        Sets the cooldown timer to expire after duration seconds.
+    cooldown_active() -> bool
+        Returns true if the cooldown timer has not yet expired.
+    qsize() -> int
+        Returns the number of commands waiting.
+    get_stats() -> dict
+        Returns the queue depth and wait metrics.
+    """
+
+    LOWEST_PRIORITY = 2
+
+    # Names which can be used for priorities in the configuration
+    PRIORITY_NAMES = {"broadcaster": 0,
+                      "moderator": 0,
+                      "subscriber": 1,
+                      "everyone": 2}
+
+    def __init__(self,
+                 timeout = None,
+                 max_depth = 100,
+                 shed_depth = None,
+                 max_wait = 30.0,
+                 coalesce = True,
+                 priorities = None):
+        self.timeout    = timeout
+        self.max_depth  = max_depth
+        self.shed_depth = shed_depth
+        self.max_wait   = max_wait
+        self.coalesce   = coalesce
+        self.priorities = dict(priorities or {})
+        self.stats      = Counter()
+
+        self.lock           = threading.Lock()
+        self.not_empty      = threading.Condition(self.lock)
+        self.cooldown_until = 0.0
+        self.internal       = []    # commands without a user, in order
+        self.ungated        = []    # heap of _Entry
+        self.gated          = []    # heap of _Entry
+        self.waiting        = {}    # (key, args, user name): _Entry
+        self.depth          = 0
+        self.seq            = itertools.count()
+
+    @classmethod
+    def from_config(cls, config, timeout = None):
+        """Creates a queue from the admission configuration.
+
+        Parameters
+        ----------
+        config : dict
+            Optional "max_depth", "shed_depth", "max_wait",
+            "coalesce", and "priorities" mapping command names
+            to a priority number or name (e.g. "subscriber").
+        timeout : float
+            How long the cooldown runs after a command is
+            taken out, until it reports done or failed.
+
+        Raises
+        ------
+        ValueError
+            If a priority is invalid.
+        """
+
+        priorities = dict()
+        for name, priority in config.get("priorities", {}).items():
+            priority = cls.PRIORITY_NAMES.get(str(priority).lower(), priority)
+            if priority not in range(cls.LOWEST_PRIORITY + 1):
+                raise ValueError("Priority of command '%s' must be one of"
+                                 " %s or 0 to %d: %s"
+                                 % (name, list(cls.PRIORITY_NAMES),
+                                    cls.LOWEST_PRIORITY, priority))
+            priorities[name.lower()] = priority
+
+        return cls(timeout    = timeout,
+                   max_depth  = int(config.get("max_depth", 100)),
+                   shed_depth = config.get("shed_depth"),
+                   max_wait   = config.get("max_wait", 30.0),
+                   coalesce   = config.get("coalesce", True),
+                   priorities = priorities)
+
+    def priority(self, cmd, key):
+        """Returns the priority of a command; lower runs first."""
+
+        if key in self.priorities:
+            return self.priorities[key]
+        if cmd.user.broadcaster or cmd.user.moderator:
+            return 0
+        if cmd.user.subscriber:
+            return 1
+        return self.LOWEST_PRIORITY
+
+    def put(self, cmd, key = None, gated = True):
+        """Queues a command.
+
+        Parameters
+        ----------
+        cmd : TwitchCommand
+            The command.
+        key : str
+            Name which identifies the command, for priorities
+            and coalescing. Defaults to the action in lower case.
+        gated : bool
+            Whether the command waits for the cooldown timer.
+
+        Returns
+        -------
+        bool
+            Whether the command was admitted (or merged with a
+            waiting one). Internal commands are always admitted.
+        """
+
+        with self.lock:
+            if cmd.user is None:
+                self.internal.append(cmd)
+                self.not_empty.notify()
+                return True
+
+            if key is None:
+                key = cmd.action.lower()
+            priority = self.priority(cmd, key)
+
+            if self.coalesce:
+                waiting = self.waiting.get(self._coalesce_key(key, cmd))
+                if waiting is not None:
+                    self.stats["coalesced"] += 1
+                    if priority < waiting.priority:
+                        self._remove(waiting)
+                        self._push(_Entry(priority, waiting.seq, cmd, key,
+                                          waiting.gated, waiting.enqueued))
+                    return True
+
+            if self.depth >= self.max_depth:
+                victim = self._newest_below(priority)
+                if victim is None:
+                    self.stats["rejected"] += 1
+                    return False
+                self._remove(victim)
+                self.stats["replaced"] += 1
+            elif (self.shed_depth is not None
+                    and self.depth >= self.shed_depth
+                    and priority >= self.LOWEST_PRIORITY):
+                self.stats["shed"] += 1
+                return False
+
+            self._push(_Entry(priority, next(self.seq), cmd, key, gated,
+                              time.monotonic()))
+            self.stats["admitted"] += 1
+            if self.depth > self.stats["depth_max"]:
+                self.stats["depth_max"] = self.depth
+            self.not_empty.notify()
+            return True
+
+    def get(self, block = True, timeout = None):
+        """Takes out the next command, like Queue.get.
+
+        Raises
+        ------
+        queue.Empty
+            If no command can be taken out in time.
+        """
+
+        deadline = None
+        if block and timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                cmd = self._next(now)
+                if cmd is not None:
+                    return cmd
+                if not block:
+                    raise Empty
+                wait = self._next_ready(now)
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise Empty
+                    wait = remaining if wait is None else min(wait, remaining)
+                self.not_empty.wait(wait)
+
+    def set_cooldown(self, duration):
+        """Sets the cooldown timer to expire after duration seconds."""
+
+        with self.lock:
+            self.cooldown_until = time.monotonic() + max(0.0, duration)
+            self.not_empty.notify_all()
+
+    def cooldown_active(self):
+        """Returns true if the cooldown timer has not yet expired."""
+
+        return time.monotonic() < self.cooldown_until
+
+    def qsize(self):
+        """Returns the number of commands waiting."""
+
+        with self.lock:
+            return self.depth + len(self.internal)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def get_stats(self):
+        """Returns the queue depth and wait metrics.
+
+        Returns
+        -------
+        dict
+            The counters, the current depth, and the average
+            and longest wait of released commands in seconds.
+        """
+
+        with self.lock:
+            stats = dict(self.stats)
+            stats["depth"] = self.depth
+        released = stats.get("released", 0)
+        stats["wait_average"] = (stats.get("wait_total", 0.0) / released
+                                 if released else 0.0)
+        return stats
+
+    @staticmethod
+    def _coalesce_key(key, cmd):
+        """Returns what identifies duplicates of a command."""
+
+        return (key, cmd.args, cmd.user.name)
+
+    def _push(self, entry):
+        heapq.heappush(self.gated if entry.gated else self.ungated, entry)
+        if self.coalesce:
+            self.waiting[self._coalesce_key(entry.key, entry.cmd)] = entry
+        self.depth += 1
+
+    def _remove(self, entry):
+        """Removes a waiting entry; it's skipped once it reaches the top."""
+
+        entry.removed = True
+        self._forget(entry)
+
+    def _forget(self, entry):
+        coalesce_key = self._coalesce_key(entry.key, entry.cmd)
+        if self.waiting.get(coalesce_key) is entry:
+            del self.waiting[coalesce_key]
+        self.depth -= 1
+
+    def _pop(self, heap, now):
+        """Pops the top live entry of a heap, dropping expired ones."""
+
+        while heap:
+            entry = heap[0]
+            if entry.removed:
+                heapq.heappop(heap)
+                continue
+            if (self.max_wait is not None
+                    and now - entry.enqueued > self.max_wait):
+                heapq.heappop(heap)
+                self._forget(entry)
+                self.stats["expired"] += 1
+                continue
+            return entry
+        return None
+
+    def _next(self, now):
+        """Takes out the next command which may run now, if any."""
+
+        if self.internal:
+            return self.internal.pop(0)
+
+        entry = self._pop(self.ungated, now)
+        if entry is None and now >= self.cooldown_until:
+            entry = self._pop(self.gated, now)
+            if entry is not None and self.timeout is not None:
+                self.cooldown_until = now + self.timeout
+        if entry is None:
+            return None
+
+        heapq.heappop(self.gated if entry.gated else self.ungated)
+        self._forget(entry)
+        wait = now - entry.enqueued
+        self.stats["released"] += 1
+        self.stats["wait_total"] += wait
+        if wait > self.stats["wait_max"]:
+            self.stats["wait_max"] = wait
+        return entry.cmd
+
+    def _next_ready(self, now):
+        """Returns how long until a waiting command may run, if known."""
+
+        if self.gated and now < self.cooldown_until:
+            return self.cooldown_until - now
+        return None
+
+    def _newest_below(self, priority):
+        """Returns the newest waiting entry of lower priority, if any.
+
+        Only runs when the queue is full, so a linear scan of
+        at most max_depth entries is fine.
+        """
+
+        victim = None
+        for entry in itertools.chain(self.gated, self.ungated):
+            if entry.removed or entry.priority <= priority:
+                continue
+            if (victim is None
+                    or (entry.priority, entry.seq)
+                        > (victim.priority, victim.seq)):
+                victim = entry
+        return victim
@@ -0,0 +1,199 @@
+import aiohttp
+import asyncio
+import logging
+import time
+from twitch.TwitchApi import AppToken
+
+
+class AsyncTwitchApi(object):
+    """
+    Asynchronous Twitch API class.
+
+    Provides the same API as TwitchApi, but as coroutines
+    built on asyncio and aiohttp, so many lookups can be
+    in flight at once from a single thread. Requires the
+    aiohttp package. Unlike TwitchApi, results are not
+    cached.
+
+    Token refreshes are single-flight: when several calls
+    find the app token expired at the same time, only one
+    of them requests a new token and the others wait for it.
+
+    Attributes
+    ----------
+    client_id : str
+        Twitch client ID, from dev.twitch.tv.
+    client_secret : str
+        Twitch client secret, from dev.twitch.tv.
+    pool_size : int
+        Maximum number of concurrent connections.
+    timeout : float
+        Total timeout for each request, in seconds.
+    api_url : str
+        Base URL of the Twitch Helix API.
+    auth_url : str
+        URL used to request app tokens.
+
+    Methods
+    -------
+    is_follower(from_id : str, to_id : str) -> bool
+        Coroutine. Check whether from_id is a follower of to_id.
+
+    get_user_id(target_user : str) -> str
+        Coroutine. Return the numerical user ID of the given username.
+
+    close()
+        Coroutine. Close the underlying HTTP session.
+    """
+
+    def __init__(self, client_id, client_secret,
+                 pool_size = 10,
+                 timeout = 10.0,
+                 api_url  = "https://api.twitch.tv/helix",
+                 auth_url = "https://id.twitch.tv/oauth2/token"):
+        self.client_id     = client_id
+        self.client_secret = client_secret
+        self.pool_size     = pool_size
+        self.timeout       = timeout
+        self.api_url       = api_url.rstrip("/")
+        self.auth_url      = auth_url
+        self.app_token     = AppToken(None, 0)
+        self.log = logging.getLogger(__name__)
+
+        # Both are created lazily, since they must belong
+        # to the event loop the coroutines run on.
+        self._session       = None
+        self._token_refresh = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _get_session(self):
+        """Returns the HTTP session, creating it if necessary."""
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit = self.pool_size)
+            timeout   = aiohttp.ClientTimeout(total = self.timeout)
+            self._session = aiohttp.ClientSession(
+                connector = connector,
+                timeout   = timeout,
+                headers   = {"Client-ID": self.client_id})
+        return self._session
+
+    async def _refresh_app_token(self):
+        """Refreshes the Twitch app token when necessary.
+
+        The first caller to find the token near expiration
+        starts the refresh; every other caller awaits that
+        same refresh instead of starting its own.
+        """
+
+        # Do nothing if the token is not nearing expiration.
+        if self.app_token.expires > (time.time() + 5*60):
+            self.log.debug("Twitch API token is still fresh.")
+            return
+
+        if self._token_refresh is None:
+            self._token_refresh = asyncio.ensure_future(
+                self._request_app_token())
+        refresh = self._token_refresh
+        try:
+            # Shield the shared refresh so one caller being
+            # cancelled does not cancel it for everyone else.
+            await asyncio.shield(refresh)
+        finally:
+            if refresh.done() and self._token_refresh is refresh:
+                self._token_refresh = None
+
+    async def _request_app_token(self):
+        """Requests a new app token from Twitch."""
+
+        if self.app_token.expires > time.time():
+            self.log.debug("Twitch API token expires in %d seconds."
+                           " Getting new token."
+                           % (self.app_token.expires - time.time()))
+        else:
+            self.log.debug("Twitch API token expired %d seconds ago."
+                           " Getting new token."
+                           % (time.time() - self.app_token.expires))
+
+        params = {
+            "client_id"     : self.client_id,
+            "client_secret" : self.client_secret,
+            "grant_type"    : "client_credentials"
+        }
+
+        try:
+            async with self._get_session().post(self.auth_url,
+                                                params = params) as response:
+                response.raise_for_status()
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # If expired, raise exception. Otherwise, just log a warning.
+            if time.time() > self.app_token.expires:
+                raise
+            else:
+                self.log.warning("Failed to refresh Twitch API token: %s"
+                                 % str(e))
+        else:
+            self.app_token = AppToken(data["access_token"],
+                                      time.time() + data["expires_in"])
+
+    async def _call_api(self, action, endpoint, params):
+        """Helper coroutine that makes the actual Twitch API call.
+
+        See TwitchApi._call_api.
+        """
+
+        await self._refresh_app_token()
+
+        self.log.debug("Calling Twitch API: %s %s(%s)"
+                       % (action, endpoint, str(params)))
+        headers = {
+            "Authorization": "Bearer %s" % self.app_token.data
+        }
+        async with self._get_session().request(
+                action,
+                "%s/%s" % (self.api_url, endpoint.strip("/")),
+                params  = params,
+                headers = headers) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def is_follower(self, from_id, to_id):
+        """Checks whether from_id is a follower of to_id.
+
+        See TwitchApi.is_follower.
+        """
+
+        self.log.info("Calling Twitch API: Does user ID %s follow user ID %s?"
+                      % (from_id, to_id))
+        response = await self._call_api("GET", "/users/follows",
+                                        {"from_id": from_id, "to_id": to_id})
+        self.log.info("Twitch API response: %s"
+                      % ("Yes" if response["total"] == 1 else "No"))
+        return response["total"] == 1
+
+    async def get_user_id(self, login):
+        """Returns the numerical user ID of the given username.
+
+        See TwitchApi.get_user_id.
+        """
+
+        self.log.info("Calling Twitch API: What is %s's user ID?"
+                      % login)
+        response = await self._call_api("GET", "users",
+                                        {"login": login})
+        self.log.info("Twitch API response: %s's user ID is %s"
+                      % (login, response["data"][0]["id"]))
+        return response["data"][0]["id"]
+
+    async def close(self):
+        """Closes the underlying HTTP session."""
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,320 @@
+from collections import Counter, deque
+import time
+import unicodedata
+from twitch.RateLimiter import TokenBucket
+
+
+# Longest line allowed by IRC, including the trailing CR LF
+IRC_MAX_LINE = 512
+
+# Longest message Twitch accepts, in characters
+TWITCH_MAX_CHARS = 500
+
+# Characters which belong to the character before them
+_ZERO_WIDTH_JOINER = "\u200d"
+
+
+def message_budget(nickname, channel):
+    """Returns how many bytes of text fit in one chat message.
+
+    Twitch relays a message to the chat as the line
+    ":nick!nick@nick.tmi.twitch.tv PRIVMSG #channel :text",
+    which must fit in IRC_MAX_LINE bytes.
+    """
+
+    nickname = nickname.lower()
+    line = (":%s!%s@%s.tmi.twitch.tv PRIVMSG %s :\r\n"
+            % (nickname, nickname, nickname, channel))
+    return IRC_MAX_LINE - len(line.encode("utf-8"))
+
+
+def _joins_previous(char):
+    """Returns true if char can't start a piece of a split word."""
+
+    return (char == _ZERO_WIDTH_JOINER
+            or unicodedata.combining(char) != 0
+            or "\ufe00" <= char <= "\ufe0f")
+
+
+def _split_word(word, max_bytes, max_chars):
+    """Splits a word too long for one message between characters.
+
+    Never splits a character's UTF-8 bytes, and avoids
+    separating accents and emoji joiners from the character
+    they belong to.
+    """
+
+    pieces = []
+    start = 0
+    size = 0
+    for index, char in enumerate(word):
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > max_bytes or index - start >= max_chars:
+            cut = index
+            while cut > start + 1 and (_joins_previous(word[cut])
+                                       or word[cut - 1] == _ZERO_WIDTH_JOINER):
+                cut -= 1
+            pieces.append(word[start:cut])
+            size = len(word[cut:index].encode("utf-8"))
+            start = cut
+        size += char_size
+    pieces.append(word[start:])
+    return pieces
+
+
+def split_message(text, max_bytes, max_chars = TWITCH_MAX_CHARS):
+    """Splits text into messages which fit in the limits.
+
+    Splits between words, joining them with single spaces,
+    and only splits words which are too long on their own.
+
+    Parameters
+    ----------
+    text : str
+        The text to split.
+    max_bytes : int
+        Most UTF-8 bytes per message, see message_budget.
+    max_chars : int
+        Most characters per message.
+
+    Returns
+    -------
+    list
+        The messages.
+    """
+
+    if len(text) <= max_chars and len(text.encode("utf-8")) <= max_bytes:
+        return [text]
+
+    messages = []
+    current = []
+    size = 0
+    chars = 0
+    for word in text.split():
+        word_size = len(word.encode("utf-8"))
+        if current and (size + 1 + word_size > max_bytes
+                        or chars + 1 + len(word) > max_chars):
+            messages.append(" ".join(current))
+            current, size, chars = [], 0, 0
+        if word_size > max_bytes or len(word) > max_chars:
+            pieces = _split_word(word, max_bytes, max_chars)
+            messages.extend(pieces[:-1])
+            word = pieces[-1]
+            word_size = len(word.encode("utf-8"))
+        if current:
+            size += 1
+            chars += 1
+        current.append(word)
+        size += word_size
+        chars += len(word)
+    if current:
+        messages.append(" ".join(current))
+    return messages
+
+
+class _Message(object):
+    """A line waiting to be said in chat."""
+
+    __slots__ = ("text", "size", "supersede")
+
+    def __init__(self, text, supersede):
+        self.text      = text
+        self.size      = len(text.encode("utf-8"))
+        self.supersede = supersede
+
+
+class ChatScheduler(object):
+    """
+    Queue of messages the bot says in chat.
+
+    Twitch silently drops messages sent faster than 20 per
+    30 seconds, or 100 per 30 seconds if the bot is a
+    moderator (or the broadcaster) in the channel. Lines
+    to say are therefore queued, and sent by flush() only
+    as fast as a token bucket allows. To never go over the
+    limit in any 30 seconds, the bucket holds half of it,
+    and gains the other half over the 30 seconds.
+
+    Lines longer than a message allows are split between
+    words into several messages. To say more with fewer
+    messages, consecutive lines are packed into one message,
+    separated by separator, as long as the message stays
+    within max_bytes (and Twitch's 500 characters). A line
+    said with a supersede key replaces the line with the
+    same key which is still waiting, if any, e.g. so only
+    the latest vote count of a command is said.
+
+    Only the core thread may use this class.
+
+    Attributes
+    ----------
+    send : callable
+        Function which sends a message to the chat.
+    max_bytes : int
+        Most UTF-8 bytes of text per message, which depends on
+        the bot's name and the channel (see message_budget).
+    separator : str
+        Text between packed lines.
+    window : float
+        Seconds over which Twitch counts messages.
+    limit : int
+        Messages allowed per window for a regular user.
+    moderator_limit : int
+        Messages allowed per window for a moderator.
+    moderator : bool
+        Whether the bot is a moderator in the channel.
+    stats : collections.Counter
+        Counters for lines queued, superseded, split and packed,
+        and messages sent.
+
+    Methods
+    -------
+    say(text : str, supersede : str)
+        Queues a line to say.
+    set_moderator(moderator : bool)
+        Switches between the regular and moderator limits.
+    flush()
+        Sends as many waiting messages as the limits allow.
+    next_send_in() -> float
+        Returns how long until flush() can send again.
+    get_stats() -> dict
+        Returns the scheduler metrics.
+    """
+
+    def __init__(self,
+                 send,
+                 max_bytes = 450,
+                 separator = " | ",
+                 window = 30.0,
+                 limit = 20,
+                 moderator_limit = 100):
+        self.send            = send
+        self.max_bytes       = max_bytes
+        self.separator       = separator
+        self.window          = window
+        self.limit           = limit
+        self.moderator_limit = moderator_limit
+        self.moderator       = False
+        self.stats           = Counter()
+
+        self.waiting    = deque()
+        self.superseded = {}    # supersede key: _Message
+        self.bucket     = self._new_bucket(limit)
+
+    def _new_bucket(self, limit):
+        return TokenBucket(limit / 2.0 / self.window, limit / 2.0,
+                           time.monotonic())
+
+    def set_moderator(self, moderator):
+        """Switches between the regular and moderator limits."""
+
+        if moderator == self.moderator:
+            return
+        self.moderator = moderator
+        tokens = self.bucket.refill(time.monotonic())
+        self.bucket = self._new_bucket(self.moderator_limit if moderator
+                                       else self.limit)
+        # Don't hand out a fresh burst on every switch
+        self.bucket.tokens = min(self.bucket.tokens, tokens)
+
+    def say(self, text, supersede = None):
+        """Queues a line to say.
+
+        Parameters
+        ----------
+        text : str
+            The line.
+        supersede : str
+            Optional key; a waiting line with the same key is
+            replaced by this one, keeping its place in the queue.
+        """
+
+        if not text.strip():
+            return
+        self.stats["lines"] += 1
+        if supersede is not None:
+            waiting = self.superseded.get(supersede)
+            if waiting is not None:
+                waiting.text = text
+                waiting.size = len(text.encode("utf-8"))
+                self.stats["superseded"] += 1
+                return
+        message = _Message(text, supersede)
+        self.waiting.append(message)
+        if supersede is not None:
+            self.superseded[supersede] = message
+
+    def flush(self):
+        """Sends as many waiting messages as the limits allow."""
+
+        while self.waiting and self.bucket.refill(time.monotonic()) >= 1:
+            self.bucket.tokens -= 1
+            self.send(self._pack())
+            self.stats["messages"] += 1
+
+    def _pack(self):
+        """Takes the next lines which fit in a single message."""
+
+        message = self._take()
+        if message.size > self.max_bytes or len(message.text) > TWITCH_MAX_CHARS:
+            # Send the first part now, and the rest as lines of their own
+            pieces = split_message(message.text, self.max_bytes)
+            self.stats["split"] += 1
+            for piece in reversed(pieces[1:]):
+                self.waiting.appendleft(_Message(piece, None))
+            message = _Message(pieces[0], None)
+
+        text, size = message.text, message.size
+        separator_size = len(self.separator.encode("utf-8"))
+        while self.waiting:
+            following = self.waiting[0]
+            if (size + separator_size + following.size > self.max_bytes
+                    or len(text) + len(self.separator) + len(following.text)
+                        > TWITCH_MAX_CHARS):
+                break
+            self._take()
+            text += self.separator + following.text
+            size += separator_size + following.size
+            self.stats["packed"] += 1
+        return text
+
+    def _take(self):
+        message = self.waiting.popleft()
+        if message.supersede is not None:
+            del self.superseded[message.supersede]
+        return message
+
+    def next_send_in(self):
+        """Returns how long until flush() can send again.
+
+        Returns
+        -------
+        float
+            Seconds until the next message may be sent, or None
+            if no messages are waiting.
+        """
+
+        if not self.waiting:
+            return None
+        missing = 1 - self.bucket.refill(time.monotonic())
+        return max(0.0, missing / self.bucket.rate)
+
+    def qsize(self):
+        """Returns the number of lines waiting."""
+
+        return len(self.waiting)
+
+    def get_stats(self):
+        """Returns the scheduler metrics.
+
+        Returns
+        -------
+        dict
+            The number of lines queued, superseded and packed
+            into other messages, messages sent, and lines still
+            waiting.
+        """
+
+        stats = dict(self.stats)
+        stats["waiting"] = len(self.waiting)
+        return stats
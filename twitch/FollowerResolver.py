@@ -0,0 +1,176 @@
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import threading
+
+
+class FollowerResolver(object):
+    """
+    Coalescing follower status resolver.
+
+    Resolves whether users follow the broadcaster without
+    making the caller wait on HTTP. Callers get a Future
+    back immediately, and lookups are handed to a small
+    worker pool as soon as they are requested; lookups
+    requested while the dispatcher is busy are handed over
+    together, as one batch.
+
+    Requests for a user ID which is already pending or
+    in flight share the existing Future, so two messages
+    from the same user never trigger two API requests.
+
+    If a loaded FollowerList is given, lookups are answered
+    from it immediately, without any API request.
+
+    Attributes
+    ----------
+    twitch_api : TwitchApi
+        The API client used to look up follower status.
+    broadcaster_id : str
+        Numerical user ID of the broadcaster being followed.
+    max_workers : int
+        Maximum number of concurrent API requests.
+    max_known : int
+        Maximum number of users whose last known status is kept.
+    follower_list : FollowerList
+        Optional preloaded list of the broadcaster's followers.
+    stats : collections.Counter
+        Counters for requested, deduplicated, preloaded and
+        dispatched lookups, dispatched batches, and failed lookups.
+
+    Methods
+    -------
+    resolve(user_id : str) -> concurrent.futures.Future
+        Returns a Future which resolves to True if the user
+        follows the broadcaster.
+    last_known(user_id : str) -> bool
+        Returns the last successfully resolved status of
+        the user, or None if it was never resolved.
+    shutdown()
+        Stops dispatching and waits for running lookups.
+    """
+
+    def __init__(self, twitch_api, broadcaster_id,
+                 max_workers = 4, max_known = 10000,
+                 follower_list = None):
+        self.twitch_api     = twitch_api
+        self.broadcaster_id = broadcaster_id
+        self.max_workers    = max_workers
+        self.max_known      = max_known
+        self.follower_list  = follower_list
+        self.stats          = Counter()
+
+        self.log = logging.getLogger(__name__)
+
+        self._executor  = ThreadPoolExecutor(max_workers,
+                                             "FollowerResolver")
+        self._condition = threading.Condition()
+        self._pending   = dict()
+        self._in_flight = dict()
+        self._known     = OrderedDict()
+        self._running   = True
+
+        self._dispatcher = threading.Thread(target = self._dispatch)
+        self._dispatcher.name   = "FollowerResolverThread"
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+
+    def resolve(self, user_id):
+        """Requests the follower status of a user.
+
+        Parameters
+        ----------
+        user_id : str
+            Numerical user ID of the (possibly) following user.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Resolves to True if user_id follows the broadcaster,
+            or raises the exception the API call raised.
+        """
+
+        if self.follower_list is not None:
+            follower = self.follower_list.contains(user_id)
+            if follower is not None:
+                with self._condition:
+                    self.stats["requested"] += 1
+                    self.stats["preloaded"] += 1
+                future = Future()
+                future.set_result(follower)
+                return future
+
+        with self._condition:
+            self.stats["requested"] += 1
+            future = self._pending.get(user_id)
+            if future is None:
+                future = self._in_flight.get(user_id)
+            if future is not None:
+                self.stats["deduplicated"] += 1
+                return future
+
+            future = Future()
+            self._pending[user_id] = future
+            self._condition.notify()
+            return future
+
+    def last_known(self, user_id):
+        """Returns the last resolved status of a user, or None."""
+
+        with self._condition:
+            return self._known.get(user_id)
+
+    def shutdown(self):
+        """Stops dispatching and waits for running lookups."""
+
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._dispatcher.join()
+        self._executor.shutdown()
+
+    def _dispatch(self):
+        """Thread which hands pending lookups to the worker pool.
+
+        Lookups are dispatched without waiting for more to
+        arrive: each one is a request of its own, so waiting
+        would only delay it. Repeated lookups for the same user
+        are still deduplicated while pending or in flight.
+        """
+
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                batch = self._pending
+                self._pending = dict()
+                self._in_flight.update(batch)
+                self.stats["batches"] += 1
+                self.stats["dispatched"] += len(batch)
+
+            self.log.debug("Resolving follower status for %d user(s)."
+                           % len(batch))
+            for user_id, future in batch.items():
+                self._executor.submit(self._lookup, user_id, future)
+
+    def _lookup(self, user_id, future):
+        """Resolves a single lookup on the worker pool."""
+
+        try:
+            result = self.twitch_api.is_follower(user_id,
+                                                 self.broadcaster_id)
+        except Exception as e:
+            with self._condition:
+                self.stats["failed"] += 1
+                del self._in_flight[user_id]
+            future.set_exception(e)
+        else:
+            with self._condition:
+                del self._in_flight[user_id]
+                self._known[user_id] = result
+                self._known.move_to_end(user_id)
+                if len(self._known) > self.max_known:
+                    self._known.popitem(last = False)
+            future.set_result(result)
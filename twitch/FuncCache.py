@@ -1,17 +1,44 @@
-from collections import namedtuple
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import functools
+import threading
 import time
 
 
-CacheItem = namedtuple("CacheItem", ["data", "expiry"])
-CacheItem.__doc__ = """A single item in the cache.
+class _CacheEntry(object):
+    """A single item in the cache.
 
-data
-    The contents of this cache entry.
-expiry : float
-    The time in seconds (unix timestamp) at which this entry expires.
-"""
+    key
+        The key this entry is stored under.
+    data
+        The contents of this cache entry.
+    expiry : float
+        The time in seconds (monotonic clock) at which this entry expires.
+    ttl : float
+        The time to live this entry was stored with.
+    stale : float
+        The time in seconds (monotonic clock) after which this
+        entry is stale. Stale entries are still returned until
+        they expire; see FuncCache's stale_expiry.
+    """
+
+    __slots__ = ("key", "data", "expiry", "ttl", "stale")
+
+    def __init__(self, key, data, expiry, ttl, stale):
+        self.key    = key
+        self.data   = data
+        self.expiry = expiry
+        self.ttl    = ttl
+        self.stale  = stale
+
+
+class _CachedError(object):
+    """An exception stored in the cache in place of a value."""
+
+    __slots__ = ("exception",)
+
+    def __init__(self, exception):
+        self.exception = exception
 
 
 class _Cache(object):
@@ -29,54 +56,211 @@ class _Cache(object):
     directly. Objects instantiated from this class should
     instead be treated like dictionaries, using the [] operator.
     
+    Entries expire a fixed time after they were stored;
+    reading an entry marks it as recently used but does
+    not extend its lifetime. Expired entries are removed
+    proactively: entries stored with the same time to live
+    expire in the order they were stored, so each distinct
+    time to live keeps its own queue of entries in storage
+    order, and expired entries are popped off the front of
+    those queues. The queues are only looked at once the
+    soonest expiry has passed, and emptied queues are
+    dropped.
+    
+    Entries which are overwritten or evicted are not looked
+    for in the queues; they are just skipped once they reach
+    the front, as the cache no longer holds them. If such
+    entries pile up, e.g. when a few keys are written over
+    and over, the queues are compacted. Every operation is
+    amortized O(1).
+    
     Attributes
     ----------
     size : int
         The maximum number of entries allowed in the cache.
     expiry : float
         The number of seconds for which a cache entry is valid.
+    hits : int
+        Number of lookups which found a valid entry.
+    misses : int
+        Number of lookups which found no valid entry.
+    evictions : int
+        Number of entries removed to stay within size.
+    expirations : int
+        Number of entries removed because they expired.
     """
 
     def __init__(self, size, expiry, *args, **kwargs):
         self.size   = size
         self.expiry = expiry
+        # Entries, from least to most recently used.
         self.cache  = OrderedDict()
+        # For each time to live, entries from oldest to newest
+        # write, including entries no longer in the cache.
+        self.expiry_queues = dict()
+        # Number of entries in all the queues.
+        self.queued        = 0
+        # No entry expires before this time, so there is no
+        # need to look at the queues until then.
+        self.next_expiry   = float("inf")
+
+        self.hits        = 0
+        self.misses      = 0
+        self.evictions   = 0
+        self.expirations = 0
+
+    def _evict(self):
+        """Removes the least recently used entry from the cache.
+        
+        It stays queued and is skipped later, but as the least
+        recently used entry is often the oldest write too, the
+        removed entries at the front of its queue are dropped
+        straight away.
+        """
+
+        cache = self.cache
+        entry = cache.popitem(last = False)[1]
+        self.evictions += 1
+        queue = self.expiry_queues.get(entry.ttl)
+        while queue:
+            front = queue[0]
+            if cache.get(front.key) is front:
+                break
+            queue.popleft()
+            self.queued -= 1
+        if queue is not None and not queue:
+            del self.expiry_queues[entry.ttl]
+
+    def _compact(self):
+        """Drops the removed entries from every queue."""
 
-    def _has_expired(self, key):
-        """Returns true if the item has expired."""
+        cache = self.cache
+        queued = 0
+        for ttl, queue in list(self.expiry_queues.items()):
+            live = deque(entry for entry in queue
+                         if cache.get(entry.key) is entry)
+            if live:
+                self.expiry_queues[ttl] = live
+                queued += len(live)
+            else:
+                del self.expiry_queues[ttl]
+        self.queued = queued
 
-        return self.cache[key].expiry < time.monotonic()
+    def _purge(self, now):
+        """Removes every entry which has expired."""
 
-    def __setitem__(self, key, value):
-        """Adds item to cache or update existing value."""
+        if now < self.next_expiry:
+            return
 
-        # Update expiration time and move to the end.
-        self.cache[key] = CacheItem(value,
-                                    time.monotonic() + self.expiry)
+        cache = self.cache
+        next_expiry = float("inf")
+        for ttl, queue in list(self.expiry_queues.items()):
+            while queue:
+                entry = queue[0]
+                if cache.get(entry.key) is entry:
+                    if entry.expiry > now:
+                        next_expiry = min(next_expiry, entry.expiry)
+                        break
+                    del cache[entry.key]
+                    self.expirations += 1
+                queue.popleft()
+                self.queued -= 1
+            if not queue:
+                del self.expiry_queues[ttl]
+        self.next_expiry = next_expiry
+
+    def set(self, key, value, ttl = None, fresh = None):
+        """Adds item to cache or updates existing value.
+        
+        ttl overrides the cache's default time to live. fresh
+        is how many seconds the entry is fresh for, and defaults
+        to its time to live (i.e. it never becomes stale).
+        """
+
+        if ttl is None:
+            ttl = self.expiry
+        if fresh is None:
+            fresh = ttl
+        now = time.monotonic()
+        if now >= self.next_expiry:
+            self._purge(now)
+        expiry = now + ttl
+
+        # A new entry, even for an existing key, so that the
+        # one it replaces is skipped in the queues.
+        cache = self.cache
+        entry = _CacheEntry(key, value, expiry, ttl, now + fresh)
+        cache[key] = entry
+        cache.move_to_end(key)
+        queue = self.expiry_queues.get(ttl)
+        if queue is None:
+            queue = self.expiry_queues[ttl] = deque()
+        queue.append(entry)
+        self.queued += 1
+        if expiry < self.next_expiry:
+            self.next_expiry = expiry
+
+        # If cache is now too big, remove the least recently used item.
+        if len(cache) > self.size:
+            self._evict()
+        if self.queued > 2 * len(cache) + 64:
+            self._compact()
+
+    # Adds item to cache or updates existing value.
+    __setitem__ = set
+
+    def get_entry(self, key):
+        """Retrieves an existing cache entry, or None."""
+
+        self._purge(time.monotonic())
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
         self.cache.move_to_end(key)
-        # If cache is now too big, remove the oldest item.
-        if len(self.cache) > self.size:
-            self.cache.popitem(last = False)
+        return entry
+
+    def peek(self, key):
+        """Retrieves an existing cache entry, or None.
+        
+        Unlike get_entry, this does not count as a lookup
+        and does not mark the entry as recently used.
+        """
+
+        self._purge(time.monotonic())
+        return self.cache.get(key)
 
     def __getitem__(self, key):
         """Retrieves existing cache item."""
 
-        if not self._has_expired(key):
-        # Update expiration time and move to the end.
-            self.cache[key] = CacheItem(self.cache[key].data,
-                                        time.monotonic() + self.expiry)
-            self.cache.move_to_end(key)
-            return self.cache[key].data
-        else:
-            raise KeyError("Item has expired from cache.")
+        entry = self.get_entry(key)
+        if entry is None:
+            raise KeyError("Item is not in cache or has expired.")
+        return entry.data
 
     def __contains__(self, key):
         """Checks whether the cache contains a given item."""
 
-        if key in self.cache and not self._has_expired(key):
-            return True
-        else:
-            return False
+        self._purge(time.monotonic())
+        return key in self.cache
+
+    def __len__(self):
+        """Returns the number of unexpired items in the cache."""
+
+        self._purge(time.monotonic())
+        return len(self.cache)
+
+    def stats(self):
+        """Returns hit, miss, eviction and expiration counters."""
+
+        return {
+            "hits"        : self.hits,
+            "misses"      : self.misses,
+            "evictions"   : self.evictions,
+            "expirations" : self.expirations,
+            "size"        : len(self.cache)
+        }
 
 
 class FuncCache(object):
@@ -92,25 +276,204 @@ class FuncCache(object):
     def ExampleFunction(example_param, another_param):
         ...
     
+    Like lru_cache's cache_info(), the decorated function
+    gets a cache_stats() function returning the cache's
+    hit, miss, eviction and expiration counters.
+    
+    In thread-safe mode, misses are single-flight: the first
+    caller to miss a key computes the value, and any other
+    thread calling with the same arguments meanwhile waits
+    for that result (or exception) instead of calling the
+    function again.
+    
+    Thread-safe mode also supports two ways of riding out
+    failures of whatever the function calls:
+    
+    - Stale-while-revalidate: for stale_expiry seconds after
+      an entry expires, it is still returned immediately,
+      while one of refresh_workers background threads calls
+      the function again to refresh it. If the refresh
+      fails, the stale value keeps being served and the
+      refresh is retried no sooner than error_expiry seconds
+      later.
+    - Negative caching: exceptions of the types listed in
+      cache_errors are cached for error_expiry seconds, and
+      re-raised for calls made during that time.
+    
+    When decorating a method, the cache is shared by every
+    instance of the class, but entries are keyed on self.
+    Set ignore_self to share entries across instances too.
+    
     Attributes
     ----------
     size : int
         The maximum number of entries allowed in the cache.
     expiry : float
         The number of seconds for which a cache entry is valid.
+    thread_safe : bool
+        Whether to lock the cache and deduplicate concurrent misses.
+    ignore_self : bool
+        Whether to leave the first positional argument out of the key.
+    stale_expiry : float
+        The number of seconds past expiry for which an entry
+        is served while it is refreshed. Requires thread_safe.
+    error_expiry : float
+        The number of seconds for which an exception listed in
+        cache_errors is cached. Requires thread_safe.
+    cache_errors : tuple
+        Exception types which are cached.
+    refresh_workers : int
+        The maximum number of stale entries refreshed at once.
+        Further refreshes wait for a free worker.
     """
 
-    def __init__(self, size = 1000, expiry = 5.0):
-        self.cache = _Cache(size, expiry)
+    def __init__(self, size = 1000, expiry = 5.0,
+                 thread_safe = False, ignore_self = False,
+                 stale_expiry = 0.0, error_expiry = 0.0,
+                 cache_errors = (), refresh_workers = 2):
+        if (stale_expiry or cache_errors) and not thread_safe:
+            raise ValueError("stale_expiry and cache_errors"
+                             " require thread_safe.")
+
+        self.cache        = _Cache(size, expiry + stale_expiry)
+        self.expiry       = expiry
+        self.thread_safe  = thread_safe
+        self.ignore_self  = ignore_self
+        self.stale_expiry = stale_expiry
+        self.error_expiry = error_expiry
+        self.cache_errors = tuple(cache_errors)
+        self.lock         = threading.Lock()
+        self.in_flight    = dict()
+        self.refresh_workers = refresh_workers
+        # Created on the first refresh, as most caches never need it.
+        self.refresh_pool    = None
+
+        self.stale_hits = 0
+        self.error_hits = 0
+        self.refreshes  = 0
+
+    def _make_key(self, args, kwargs):
+        """Builds the cache key for a call."""
+
+        if self.ignore_self:
+            args = args[1:]
+        return (tuple(args), tuple(sorted(kwargs.items())))
+
+    def _store(self, key, value):
+        """Stores a computed value. Call with the lock held."""
+
+        self.cache.set(key, value, fresh = self.expiry)
+
+    def _store_error(self, key, exception):
+        """Stores an exception if it should be cached.
+        
+        Call with the lock held. Never replaces a stale value,
+        which is worth more than the error during an outage.
+        """
+
+        if not (self.error_expiry > 0
+                and isinstance(exception, self.cache_errors)):
+            return
+        entry = self.cache.peek(key)
+        if entry is None or isinstance(entry.data, _CachedError):
+            self.cache.set(key, _CachedError(exception),
+                           ttl = self.error_expiry)
+        else:
+            # Wait before trying to refresh the stale value again.
+            entry.stale = time.monotonic() + self.error_expiry
+
+    def _call_single_flight(self, func, key, args, kwargs):
+        """Looks up or computes a value, one computation per key."""
+
+        with self.lock:
+            entry = self.cache.get_entry(key)
+            if entry is not None:
+                data = entry.data
+                if isinstance(data, _CachedError):
+                    self.error_hits += 1
+                elif entry.stale <= time.monotonic():
+                    self.stale_hits += 1
+                    if key not in self.in_flight:
+                        self._start_refresh(func, key, args, kwargs)
+                flight = None
+            else:
+                flight = self.in_flight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self.in_flight[key] = Future()
+
+        if flight is None:
+            if isinstance(data, _CachedError):
+                raise data.exception
+            return data
+
+        if not leader:
+            return flight.result()
+        return self._compute(func, key, args, kwargs, flight)
+
+    def _compute(self, func, key, args, kwargs, flight):
+        """Calls the function and shares the outcome with waiters."""
+
+        try:
+            value = func(*args, **kwargs)
+        except BaseException as e:
+            with self.lock:
+                self._store_error(key, e)
+                del self.in_flight[key]
+            flight.set_exception(e)
+            raise
+        with self.lock:
+            self._store(key, value)
+            del self.in_flight[key]
+        flight.set_result(value)
+        return value
+
+    def _start_refresh(self, func, key, args, kwargs):
+        """Refreshes a stale entry in the background.
+        
+        Call with the lock held.
+        """
+
+        self.refreshes += 1
+        flight = self.in_flight[key] = Future()
+
+        def refresh():
+            try:
+                self._compute(func, key, args, kwargs, flight)
+            except BaseException:
+                # The stale value remains; nobody is waiting
+                # for this refresh, so there is nobody to tell.
+                pass
+
+        if self.refresh_pool is None:
+            self.refresh_pool = ThreadPoolExecutor(self.refresh_workers,
+                                                   "FuncCacheRefresh")
+        self.refresh_pool.submit(refresh)
+
+    def _stats(self):
+        """Returns the cache's counters, taking the lock if needed."""
+
+        if self.thread_safe:
+            with self.lock:
+                stats = self.cache.stats()
+        else:
+            stats = self.cache.stats()
+        stats["stale_hits"] = self.stale_hits
+        stats["error_hits"] = self.error_hits
+        stats["refreshes"]  = self.refreshes
+        return stats
 
     def __call__(self, func):
         @functools.wraps(func)
         def decofunc(*args, **kwargs):
-            key = (tuple(args), tuple(sorted(kwargs.items())))
+            key = self._make_key(args, kwargs)
+            if self.thread_safe:
+                return self._call_single_flight(func, key, args, kwargs)
             try:
                 return self.cache[key]
             except KeyError:
                 value = func(*args, **kwargs)
                 self.cache[key] = value
                 return value
+        decofunc.cache_stats = self._stats
         return decofunc
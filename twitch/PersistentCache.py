@@ -0,0 +1,124 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+class PersistentCache(object):
+    """
+    A persistent on-disk cache backed by SQLite.
+
+    Stores JSON-serializable values by kind (e.g. "user_id"
+    or "follower") and key, so API results survive restarts.
+    Each kind has its own time to live. The database is only
+    opened on first use, and entries are read from disk one at
+    a time as they are needed, so startup costs nothing while
+    previously seen users are still resolved without HTTP.
+
+    Errors from the database are logged and otherwise ignored;
+    a broken cache file only makes the bot fall back to the API.
+
+    Attributes
+    ----------
+    path : str
+        Path to the SQLite database file.
+    ttls : dict
+        Time to live in seconds for each kind of entry.
+        Kinds which are not listed are never stored.
+
+    Methods
+    -------
+    get(kind : str, key : str) -> object
+        Returns the stored value, or None if missing or expired.
+    set(kind : str, key : str, value : object)
+        Stores a value.
+    close()
+        Closes the database.
+    """
+
+    DEFAULT_TTLS = {
+        "user_id"  : 7 * 24 * 60 * 60,
+        "follower" : 60 * 60
+    }
+
+    def __init__(self, path, ttls = None):
+        self.path = path
+        self.ttls = dict(self.DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.log  = logging.getLogger(__name__)
+
+        self._lock       = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        """Opens the database and drops expired entries.
+
+        Call with the lock held.
+        """
+
+        if self._connection is not None:
+            return self._connection
+
+        self.log.info("Opening persistent cache at %s." % self.path)
+        connection = sqlite3.connect(self.path, check_same_thread = False)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS cache ("
+                           " kind TEXT NOT NULL,"
+                           " key TEXT NOT NULL,"
+                           " value TEXT NOT NULL,"
+                           " stored REAL NOT NULL,"
+                           " PRIMARY KEY (kind, key)"
+                           ") WITHOUT ROWID")
+        now = time.time()
+        for kind, ttl in self.ttls.items():
+            connection.execute("DELETE FROM cache"
+                               " WHERE kind = ? AND stored < ?",
+                               (kind, now - ttl))
+        connection.commit()
+        self._connection = connection
+        return connection
+
+    def get(self, kind, key):
+        """Returns a stored value, or None if missing or expired."""
+
+        ttl = self.ttls.get(kind)
+        if ttl is None:
+            return None
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT value FROM cache"
+                    " WHERE kind = ? AND key = ? AND stored >= ?",
+                    (kind, key, time.time() - ttl)).fetchone()
+        except sqlite3.Error as e:
+            self.log.warning("Error reading persistent cache: %s" % str(e))
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def set(self, kind, key, value):
+        """Stores a value, replacing any existing one."""
+
+        if kind not in self.ttls:
+            return
+        try:
+            with self._lock:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache (kind, key, value, stored)"
+                    " VALUES (?, ?, ?, ?)",
+                    (kind, key, json.dumps(value), time.time()))
+                connection.commit()
+        except sqlite3.Error as e:
+            self.log.warning("Error writing persistent cache: %s" % str(e))
+
+    def close(self):
+        """Closes the database."""
+
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
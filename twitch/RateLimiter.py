@@ -0,0 +1,250 @@
+from collections import Counter, OrderedDict
+import time
+
+
+class TokenBucket(object):
+    """
+    A token bucket.
+
+    Holds up to burst tokens and gains rate tokens per second.
+    Every command takes one token, so a user can send burst
+    commands at once, and after that one every 1/rate seconds.
+
+    The bucket is only refilled when it is looked at, so idle
+    buckets cost nothing.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate    = rate
+        self.burst   = burst
+        self.tokens  = float(burst)
+        self.updated = now
+
+    def refill(self, now):
+        """Adds the tokens gained since the last refill."""
+
+        if now > self.updated:
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        return self.tokens
+
+    def full(self, now):
+        """Returns true if the bucket is back to its initial state."""
+
+        return self.refill(now) >= self.burst
+
+
+class RateLimiter(object):
+    """
+    Token bucket rate limiter for chat commands.
+
+    Keeps a bucket for every user, a bucket for every command,
+    and a single global bucket. A command is allowed only if
+    each of its buckets holds a token, in which case it takes
+    one from each; otherwise it is dropped without taking any,
+    so for example a user spamming one command doesn't use up
+    the global limit for everyone else.
+
+    Each check is a few dict lookups, whatever the number of
+    users. Buckets which have been idle long enough to fill
+    back up are forgotten, a couple per check, and the number
+    of user buckets is capped at max_users.
+
+    Attributes
+    ----------
+    global_limit : tuple
+        (rate, burst) of the bucket shared by all commands,
+        or None for no global limit.
+    user_limit : tuple
+        (rate, burst) of each user's bucket, or None.
+    command_limit : tuple
+        (rate, burst) of each command's bucket, or None.
+    command_limits : dict
+        (rate, burst) for specific commands, overriding
+        command_limit.
+    max_users : int
+        Most user buckets to keep at once.
+    stats : collections.Counter
+        Number of commands allowed, and dropped by each kind
+        of bucket.
+
+    Methods
+    -------
+    from_config(config : dict) -> RateLimiter
+        Creates a rate limiter from the rate_limits configuration.
+    allow(user : str, command : str) -> str
+        Checks and takes tokens for a command. Returns None if
+        the command is allowed, otherwise the kind of bucket
+        which dropped it: "global", "user" or "command".
+    get_stats() -> dict
+        Returns the rate limiter metrics.
+    """
+
+    def __init__(self,
+                 global_limit = None,
+                 user_limit = None,
+                 command_limit = None,
+                 command_limits = None,
+                 max_users = 10000):
+        self.global_limit   = global_limit
+        self.user_limit     = user_limit
+        self.command_limit  = command_limit
+        self.command_limits = dict(command_limits or {})
+        self.max_users      = max_users
+        self.stats          = Counter()
+
+        self.global_bucket   = None
+        self.user_buckets    = OrderedDict()
+        self.command_buckets = OrderedDict()
+
+    @classmethod
+    def from_config(cls, config):
+        """Creates a rate limiter from the rate_limits configuration.
+
+        Parameters
+        ----------
+        config : dict
+            Optional "global", "user" and "command" limits, and
+            "commands" mapping command names to their own limits.
+            Each limit is a dict with "rate", the commands per
+            second, and "burst", how many commands may be sent
+            at once.
+
+        Raises
+        ------
+        ValueError
+            If a limit is invalid.
+        """
+
+        commands = config.get("commands", {})
+        return cls(global_limit   = cls._parse_limit(config, "global"),
+                   user_limit     = cls._parse_limit(config, "user"),
+                   command_limit  = cls._parse_limit(config, "command"),
+                   command_limits = dict(
+                       (name.lower(), cls._parse_limit(commands, name))
+                       for name in commands),
+                   max_users      = int(config.get("max_users", 10000)))
+
+    @staticmethod
+    def _parse_limit(config, key):
+        """Returns the (rate, burst) of a limit, or None if not set."""
+
+        limit = config.get(key)
+        if limit is None:
+            return None
+        try:
+            rate  = float(limit["rate"])
+            burst = float(limit.get("burst", 1))
+        except (TypeError, KeyError, ValueError, AttributeError):
+            raise ValueError("Rate limit '%s' must be an object with a"
+                             " numeric 'rate' and optional 'burst': %s"
+                             % (key, limit))
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate limit '%s' needs a rate above 0 and"
+                             " a burst of at least 1: %s" % (key, limit))
+        return (rate, burst)
+
+    def allow(self, user, command, now = None):
+        """Checks and takes tokens for a command.
+
+        Parameters
+        ----------
+        user : str
+            Name of the user who sent the command.
+        command : str
+            Name of the command.
+        now : float
+            The current time.monotonic(), if already known.
+
+        Returns
+        -------
+        str
+            None if the command is allowed, otherwise the kind of
+            bucket which dropped it: "global", "user" or "command".
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        user_bucket = None
+        if self.user_limit is not None:
+            user_bucket = self._bucket(self.user_buckets, user,
+                                       self.user_limit, now)
+            if user_bucket.tokens < 1:
+                return self._drop("user")
+
+        command_bucket = None
+        command_limit = self.command_limits.get(command, self.command_limit)
+        if command_limit is not None:
+            command_bucket = self._bucket(self.command_buckets, command,
+                                          command_limit, now)
+            if command_bucket.tokens < 1:
+                return self._drop("command")
+
+        if self.global_limit is not None:
+            if self.global_bucket is None:
+                self.global_bucket = TokenBucket(self.global_limit[0],
+                                                 self.global_limit[1], now)
+            if self.global_bucket.refill(now) < 1:
+                return self._drop("global")
+            self.global_bucket.tokens -= 1
+
+        if user_bucket is not None:
+            user_bucket.tokens -= 1
+        if command_bucket is not None:
+            command_bucket.tokens -= 1
+        self.stats["allowed"] += 1
+        return None
+
+    def _bucket(self, buckets, key, limit, now):
+        """Returns the refilled bucket for key, creating it if needed.
+
+        Buckets are kept in order of last use, so the least
+        recently used ones are at the front for _prune.
+        """
+
+        bucket = buckets.get(key)
+        if bucket is None:
+            self._prune(buckets, now)
+            bucket = buckets[key] = TokenBucket(limit[0], limit[1], now)
+        else:
+            buckets.move_to_end(key)
+            bucket.refill(now)
+        return bucket
+
+    def _prune(self, buckets, now):
+        """Forgets up to two buckets which are full or over max_users.
+
+        A full bucket is the same as a new one, so forgetting it
+        changes nothing.
+        """
+
+        for _ in range(2):
+            if not buckets:
+                return
+            key = next(iter(buckets))
+            if len(buckets) < self.max_users and not buckets[key].full(now):
+                return
+            del buckets[key]
+
+    def _drop(self, kind):
+        self.stats["dropped_" + kind] += 1
+        return kind
+
+    def get_stats(self):
+        """Returns the rate limiter metrics.
+
+        Returns
+        -------
+        dict
+            The number of commands allowed and dropped by each
+            kind of bucket, and the number of buckets tracked.
+        """
+
+        stats = dict(self.stats)
+        stats["user_buckets"]    = len(self.user_buckets)
+        stats["command_buckets"] = len(self.command_buckets)
+        return stats
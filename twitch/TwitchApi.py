@@ -1,8 +1,12 @@
 from collections import namedtuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import requests
 import logging
+import threading
 import time
 from twitch.FuncCache import FuncCache
+from twitch.PersistentCache import PersistentCache
 
 
 AppToken = namedtuple("AppToken", ["data", "expires"])
@@ -22,12 +26,34 @@ class TwitchApi(object):
     app tokens automatically. API call results are
     cached by default.
     
+    All requests go through a single pooled keep-alive
+    session, so after the first call each request costs
+    one round trip instead of a fresh TCP and TLS handshake.
+    
     Attributes
     ----------
     client_id : str
         Twitch client ID, from dev.twitch.tv.
     client_secret : str
         Twitch client secret, from dev.twitch.tv.
+    pool_size : int
+        Maximum number of keep-alive connections per host.
+    timeout : float or (float, float)
+        Connect and read timeout for each request, in seconds.
+    retries : int
+        How many times a failed request is retried.
+    backoff_factor : float
+        Exponential backoff factor between retries, in seconds.
+    api_url : str
+        Base URL of the Twitch Helix API.
+    auth_url : str
+        URL used to request app tokens.
+    cache_path : str
+        Path to an SQLite file used to keep user IDs and follows
+        across restarts, or None to disable it.
+    cache_ttls : dict
+        Time to live in seconds for each kind of persistently
+        cached data ("user_id" and "follower").
     
     Methods
     -------
@@ -36,20 +62,125 @@ class TwitchApi(object):
     
     get_user_id(target_user : str) -> str
         Return the numerical user ID of the given username.
+    
+    get_followers_page(to_id : str, cursor : str) -> (list, str)
+        Return one page of user IDs following to_id.
+    
+    connection_stats() -> dict
+        Return request, connection, and connection reuse counts.
+    
+    close()
+        Close all pooled connections.
     """
 
-    def __init__(self, client_id, client_secret):
-        self.client_id     = client_id
-        self.client_secret = client_secret
-        self.app_token     = AppToken(None, 0)
+    def __init__(self, client_id, client_secret,
+                 pool_size = 10,
+                 timeout = (3.05, 10.0),
+                 retries = 3,
+                 backoff_factor = 0.3,
+                 api_url  = "https://api.twitch.tv/helix",
+                 auth_url = "https://id.twitch.tv/oauth2/token",
+                 cache_path = None,
+                 cache_ttls = None):
+        self.client_id      = client_id
+        self.client_secret  = client_secret
+        self.pool_size      = pool_size
+        # JSON config supplies the (connect, read) pair as a list.
+        self.timeout        = (tuple(timeout) if isinstance(timeout, list)
+                               else timeout)
+        self.retries        = retries
+        self.backoff_factor = backoff_factor
+        self.api_url        = api_url.rstrip("/")
+        self.auth_url       = auth_url
+        self.app_token      = AppToken(None, 0)
+        self.token_lock     = threading.Lock()
         self.log = logging.getLogger(__name__)
 
+        self.session = self._create_session()
+
+        if cache_path is not None:
+            self.store = PersistentCache(cache_path, cache_ttls)
+        else:
+            self.store = None
+
+    def _create_session(self):
+        """Creates the pooled HTTP session used for all requests.
+        
+        Retries are only made for connection errors and
+        for responses which indicate a temporary problem
+        on Twitch's side.
+        """
+
+        retry = Retry(total = self.retries,
+                      backoff_factor = self.backoff_factor,
+                      status_forcelist = (429, 500, 502, 503, 504),
+                      allowed_methods = frozenset(["GET", "POST"]),
+                      raise_on_status = False)
+        self.adapter = HTTPAdapter(pool_connections = 2,
+                                   pool_maxsize = self.pool_size,
+                                   max_retries = retry)
+
+        session = requests.Session()
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+        session.headers["Client-ID"] = self.client_id
+        return session
+
+    def connection_stats(self):
+        """Returns connection reuse counters for the session.
+        
+        Returns
+        -------
+        dict
+            "requests" is the number of requests sent,
+            "connections" the number of connections opened,
+            and "reused" the number of requests which were
+            sent over an already open connection.
+        """
+
+        pools = self.adapter.poolmanager.pools
+        requests_sent = 0
+        connections   = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests_sent += pool.num_requests
+                connections   += pool.num_connections
+        return {
+            "requests"    : requests_sent,
+            "connections" : connections,
+            "reused"      : max(0, requests_sent - connections)
+        }
+
+    def close(self):
+        """Closes all pooled connections."""
+
+        self.log.debug("Twitch API connection stats: %s"
+                       % self.connection_stats())
+        self.session.close()
+        if self.store is not None:
+            self.store.close()
+
+    def _load(self, kind, key):
+        """Returns a value from the persistent cache, or None."""
+
+        if self.store is None:
+            return None
+        return self.store.get(kind, key)
+
+    def _save(self, kind, key, value):
+        """Saves a value to the persistent cache, if enabled."""
+
+        if self.store is not None:
+            self.store.set(kind, key, value)
+
     def _refresh_app_token(self):
         """Refreshes the Twitch app token when necessary.
         
         This method will request a new app token when
-        the existing one is near or at expiration.
-        has expired.
+        the existing one is near or at expiration. It is
+        safe to call from multiple threads; only one of
+        them will request a new token.
         
         See: https://dev.twitch.tv/docs/authentication
                     /getting-tokens-oauth/#oauth-client-credentials-flow
@@ -59,7 +190,17 @@ class TwitchApi(object):
         if self.app_token.expires > (time.time() + 5*60):
             self.log.debug("Twitch API token is still fresh.")
             return
-        
+
+        with self.token_lock:
+            # Another thread may have refreshed the token
+            # while this one was waiting for the lock.
+            if self.app_token.expires > (time.time() + 5*60):
+                return
+            self._request_app_token()
+
+    def _request_app_token(self):
+        """Requests a new app token from Twitch."""
+
         if self.app_token.expires > time.time():
             self.log.debug("Twitch API token expires in %d seconds."
                            " Getting new token."
@@ -79,21 +220,23 @@ class TwitchApi(object):
 
         try:
             # Allow requests to raise an exception on error.
-            response = requests.post("https://id.twitch.tv/oauth2/token",
-                                     params = params)
+            response = self.session.post(self.auth_url,
+                                         params  = params,
+                                         timeout = self.timeout)
             response.raise_for_status()
-        except RequestException as e:
+        except requests.RequestException as e:
             # If expired, raise exception. Otherwise, just log a warning.
             if time.time() > self.app_token.expires:
+                raise
+            else:
                 self.log.warning("Failed to refresh Twitch API token: %s"
                                  % str(e))
-            else:
-                raise
         else:
-            # Convert response to json.
+            # Convert response to json. Twitch reports the
+            # lifetime of the token, not its expiration time.
             data = response.json()
             self.app_token = AppToken(data["access_token"],
-                                      data["expires_in"])
+                                      time.time() + data["expires_in"])
 
     def _call_api(self, action, endpoint, params):
         """Helper method that makes the actual Twitch API call.
@@ -124,14 +267,21 @@ class TwitchApi(object):
         headers = {
             "Authorization": "Bearer %s" % self.app_token.data
         }
-        response = requests.get("https://api.twitch.tv/helix/%s"
-                                % endpoint.strip("/"),
-                                params  = params,
-                                headers = headers)
+        response = self.session.request(action,
+                                        "%s/%s" % (self.api_url,
+                                                   endpoint.strip("/")),
+                                        params  = params,
+                                        headers = headers,
+                                        timeout = self.timeout)
         response.raise_for_status()
         return response.json()
 
-    @FuncCache(size = 1000, expiry = 5.0)
+    # During a Twitch API outage, keep known followers for up
+    # to an hour, and retry failing lookups at most every 10s.
+    @FuncCache(size = 1000, expiry = 5.0,
+               stale_expiry = 3600.0, error_expiry = 10.0,
+               cache_errors = (requests.RequestException,),
+               thread_safe = True, ignore_self = True)
     def is_follower(self, from_id, to_id):
         """Checks whether from_id is a follower of to_id.
         
@@ -151,18 +301,28 @@ class TwitchApi(object):
             True if user from_id is following user to_id.
         """
 
+        # Only follows are kept across restarts. A viewer who
+        # doesn't follow yet may follow any moment, so "no" is
+        # never kept for longer than the in-memory expiry.
+        store_key = "%s:%s" % (from_id, to_id)
+        if self._load("follower", store_key):
+            return True
+
         self.log.info("Calling Twitch API: Does user ID %s follow user ID %s?"
                       % (from_id, to_id))
         response = self._call_api("GET", "/users/follows",
                                   {"from_id": from_id, "to_id": to_id})
         self.log.info("Twitch API response: %s"
                       % ("Yes" if response["total"] == 1 else "No"))
-        if response["total"] == 1:
-            return True
-        else:
-            return False
+        follower = response["total"] == 1
+        if follower:
+            self._save("follower", store_key, follower)
+        return follower
 
-    @FuncCache(size = 1000, expiry = 5.0)
+    @FuncCache(size = 1000, expiry = 5.0,
+               stale_expiry = 86400.0, error_expiry = 10.0,
+               cache_errors = (requests.RequestException,),
+               thread_safe = True, ignore_self = True)
     def get_user_id(self, login):
         """Returns the numerical user ID of the given username.
         
@@ -180,10 +340,48 @@ class TwitchApi(object):
             Numerical user ID.
         """
 
+        user_id = self._load("user_id", login)
+        if user_id is not None:
+            return user_id
+
         self.log.info("Calling Twitch API: What is %s's user ID?"
                       % login)
         response = self._call_api("GET", "users",
                                   {"login": login})
         self.log.info("Twitch API response: %s's user ID is %s"
                       % (login, response["data"][0]["id"]))
-        return response["data"][0]["id"]
+        user_id = response["data"][0]["id"]
+        self._save("user_id", login, user_id)
+        return user_id
+
+    def get_followers_page(self, to_id, cursor = None):
+        """Returns one page of the users following to_id.
+        
+        Pages are ordered from the newest follower to the oldest.
+        This is not cached, since it is meant for loading the
+        complete follower list; see FollowerList.
+        
+        See: https://dev.twitch.tv/docs/api
+                    /reference/#get-users-follows
+
+        Parameters
+        ----------
+        to_id : str
+            Numerical user ID of the followed user.
+        cursor : str
+            Cursor returned with the previous page, or None
+            for the first page.
+        
+        Returns
+        -------
+        (list, str)
+            Numerical user IDs on this page, and the cursor for
+            the next page (None if this is the last page).
+        """
+
+        params = {"to_id": to_id, "first": 100}
+        if cursor is not None:
+            params["after"] = cursor
+        response = self._call_api("GET", "/users/follows", params)
+        ids = [follow["from_id"] for follow in response["data"]]
+        return ids, response.get("pagination", {}).get("cursor")
@@ -1,4 +1,4 @@
-from queue import Queue, Empty
+from queue import Empty
 import irc.bot
 import logging
 import threading
@@ -6,6 +6,8 @@ import time
 import os
 from twitch.TwitchBotCore import TwitchBotCore, TwitchCommand, TwitchUser
 from twitch.TwitchApi import TwitchApi
+from twitch.WakeupQueue import WakeupQueue
+from twitch.AdmissionQueue import AdmissionQueue
 
 
 class TwitchBot(object):
@@ -38,6 +40,19 @@ class TwitchBot(object):
         Client secert from dev.twitch.tv for access to the Twitch API.
     no_cooldown : set
         List of commands which bypass the cooldown timer completely.
+    api_options : dict
+        Optional keyword arguments for the TwitchApi client,
+        such as pool_size, timeout, retries and backoff_factor.
+    preload_followers : bool
+        Whether to load the broadcaster's complete follower list
+        in the background, so follower checks need no API calls.
+    rate_limits : dict
+        Optional per-user, per-command and global rate limits.
+        See RateLimiter.from_config for the format.
+    admission : dict
+        Optional settings for the queue of commands waiting
+        to run, such as its depth and per-command priorities.
+        See AdmissionQueue.from_config for the format.
     
     Methods
     -------
@@ -45,7 +60,19 @@ class TwitchBot(object):
         Method which is called by the bot whenever a user
         in chat invokes a command by prepending their message with '!'.
         The cmd dict is a dict version of TwitchCommand and TwitchUser.
-    twitch_say(text : str)
+    is_known_command(action : str) -> bool
+        Method which is called by the bot core to decide whether
+        a command exists. Override this so chat messages for
+        commands which don't are dropped as early as possible.
+    canonical_command(action : str) -> str
+        Method which is called by the bot core to get the name
+        which identifies a command, e.g. to resolve aliases.
+        Commands with the same name share their rate limits.
+    follower_status_required(action : str) -> bool
+        Method which is called by the bot core to decide whether
+        a command needs the user's follower status. Override this
+        to avoid Twitch API calls for commands which don't.
+    twitch_say(text : str, supersede : str)
         Have the bot say something in Twitch chat.
     twitch_done()
         Inform the bot that your action has completed.
@@ -79,7 +106,11 @@ class TwitchBot(object):
                  cooldown, timeout,
                  api_client_id,
                  api_client_secret,
-                 no_cooldown):
+                 no_cooldown,
+                 api_options = None,
+                 preload_followers = False,
+                 rate_limits = None,
+                 admission = None):
         self.server            = server
         self.port              = port
         self.username          = username
@@ -90,9 +121,12 @@ class TwitchBot(object):
         self.api_client_id     = api_client_id
         self.api_client_secret = api_client_secret
         self.no_cooldown       = no_cooldown
+        self.api_options       = api_options
+        self.preload_followers = preload_followers
+        self.rate_limits       = rate_limits
 
-        self.out_queue  = Queue()
-        self.in_queue   = Queue()
+        self.out_queue  = AdmissionQueue.from_config(admission or {}, timeout)
+        self.in_queue   = WakeupQueue()
 
         self.log = logging.getLogger(__name__)
 
@@ -127,18 +161,94 @@ class TwitchBot(object):
                       % (cmd.action, str(cmd.args)))
         pass
 
-    def twitch_say(self, text):
+    def is_known_command(self, action):
+        """Override this method to drop unknown commands early.
+        
+        Called by the bot core, from the core thread, for every
+        chat message which looks like a command, before its tags
+        are parsed or the Twitch API is called. If this returns
+        False, the message is ignored, and it neither reaches
+        on_twitch_command nor starts the cooldown timer.
+        
+        Keep this method fast and free of side effects.
+        
+        Parameters
+        ----------
+        action : str
+            The command, as typed after the '!'.
+        
+        Returns
+        -------
+        bool
+            True if the bot has this command.
+        """
+        return True
+
+    def canonical_command(self, action):
+        """Override this method if commands have several names.
+        
+        Called by the bot core, from the core thread, for every
+        known command before it is checked against the rate
+        limits. Commands with the same name share their limits.
+        
+        Keep this method fast and free of side effects.
+        
+        Parameters
+        ----------
+        action : str
+            The command, as typed after the '!'.
+        
+        Returns
+        -------
+        str
+            The name which identifies the command.
+        """
+        return action.lower()
+
+    def follower_status_required(self, action):
+        """Override this method to skip unnecessary follower lookups.
+        
+        Called by the bot core, from the core thread, for every
+        command from a user whose badges don't already rank
+        above follower (i.e. not a subscriber, moderator, or
+        the broadcaster). If this returns False, the Twitch
+        API is not called and the user's follower status is
+        passed on as None (unknown).
+        
+        Keep this method fast and free of side effects.
+        
+        Parameters
+        ----------
+        action : str
+            The command, as typed after the '!'.
+        
+        Returns
+        -------
+        bool
+            True if the follower status is needed for this command.
+        """
+        return True
+
+    def twitch_say(self, text, supersede = None):
         """Has the bot say something in Twitch chat.
         
+        Messages are sent as fast as Twitch allows, so they
+        may wait a little when the bot says a lot at once.
+        
         Parameters
         ----------
         text : str
             The text to say in chat.
+        supersede : str
+            Optional key. If a message said with the same key
+            is still waiting to be sent, it's replaced by this
+            one, e.g. to only say the latest vote count.
         """
 
         self.log.info("Telling Twitch bot core to say '%s'"
                       % text)
-        msg = TwitchCommand(None, None, None, "say", text)
+        tags = {"supersede": supersede} if supersede is not None else None
+        msg = TwitchCommand(tags, None, None, "say", text)
         self.in_queue.put(msg)
 
     def twitch_done(self):
@@ -194,7 +304,13 @@ class TwitchBot(object):
                                         self.cooldown,   self.timeout,
                                         self.api_client_id,
                                         self.api_client_secret,
-                                        self.no_cooldown)
+                                        self.no_cooldown,
+                                        self.api_options,
+                                        self.follower_status_required,
+                                        self.preload_followers,
+                                        self.is_known_command,
+                                        self.canonical_command,
+                                        self.rate_limits)
         twitch_bot_core.start()
 
     def start(self):
@@ -1,12 +1,19 @@
 from collections import namedtuple
+from collections import Counter, deque
 from queue import Empty
-from math import isclose
+import datetime
 import logging
+import select
 import ssl
+import threading
 import irc.bot
+import irc.client
 import time
-import requests
 from twitch.TwitchApi import TwitchApi
+from twitch.FollowerResolver import FollowerResolver
+from twitch.FollowerList import FollowerList
+from twitch.RateLimiter import RateLimiter
+from twitch.ChatScheduler import ChatScheduler, message_budget
 import re
 
 
@@ -21,7 +28,9 @@ Represents both commands originating from the Twitch
 bot core, and commands being sent to it.
 
 For commands being sent TO the Twitch bot core, the
-tags, badges, and user fields are currently unused.
+badges and user fields are currently unused, and the
+tags may hold a "supersede" key for "say" commands
+(see ChatScheduler.say).
 
 tags : dict
     A dictionary containing tags attached to a Twitch chat message.
@@ -51,7 +60,8 @@ moderator, and/or broadcaster.
 name : str
     The username of the Twitch user.
 follower : bool
-    Whether or not this user is following the channel owner.
+    Whether or not this user is following the channel owner,
+    or None if this could not be determined in time.
 subscriber : bool
     Whether or not this user is subscribeed to the channel owner.
 subscriber_duration : str
@@ -63,6 +73,35 @@ broadcaster : bool
 """
 
 
+class _PendingCommand(object):
+    """A parsed command waiting for its follower status."""
+
+    __slots__ = ("cmd", "key", "gated", "user_id",
+                 "started", "deadline", "finished")
+
+    def __init__(self, cmd, key, gated, user_id, started, deadline):
+        self.cmd      = cmd
+        self.key      = key
+        self.gated    = gated
+        self.user_id  = user_id
+        self.started  = started
+        self.deadline = deadline
+        self.finished = False
+
+
+# A command is a '!' within the first three characters of a
+# message, followed by the action and optionally its arguments.
+# Anything else right after the action (e.g. "!birb!") is ignored.
+_COMMAND_PATTERN = re.compile(r"^.{0,2}?!(\w+)(?:\s+(.*))?", re.DOTALL)
+
+
+def _has_pending_data(sock):
+    """Returns true if an SSL socket holds already-decrypted data."""
+
+    pending = getattr(sock, "pending", None)
+    return pending is not None and pending() > 0
+
+
 class TwitchBotCore(irc.bot.SingleServerIRCBot):
     """
     Twitch bot core.
@@ -94,10 +133,13 @@ class TwitchBotCore(irc.bot.SingleServerIRCBot):
         Twitch chat OAuth token, used in place of a password.
     channel : str
         Channel to join upon connection. Must start with '#'
-    out_queue : Queue.Queue
+    out_queue : AdmissionQueue
         Queue the core uses to send commands to the main thread.
-    in_queue : Queue.Queue
+        Must be an AdmissionQueue, which also holds the cooldown
+        timer, so commands wait for the cooldown in the queue.
+    in_queue : WakeupQueue
         Queue the cores uses to receive commands from the main thread.
+        Must be a WakeupQueue so the core can wait on it with select().
     cooldown : float
         Delay after command reports it is finished executing
         until another command can be invoked.
@@ -109,12 +151,54 @@ class TwitchBotCore(irc.bot.SingleServerIRCBot):
     api_client_secret : str
         Client secert from dev.twitch.tv for access to the Twitch API.
     no_cooldown : set
-        List of commands which bypass the cooldown timer completely.
+        List of commands which bypass the cooldown timer completely,
+        matched in any case and by any of their aliases.
+    api_options : dict
+        Optional keyword arguments for the TwitchApi client.
+    follower_status_required : callable
+        Optional function taking a command's action and returning
+        whether the command needs the user's follower status.
+        If omitted, every command gets a follower lookup.
+    is_known_command : callable
+        Optional function taking a command's action and returning
+        whether the bot has such a command. Messages with unknown
+        commands are dropped before any other work is done on them.
+        If omitted, every command is passed on.
+    canonical_command : callable
+        Optional function taking a command's action and returning
+        the name which identifies the command, so aliases share
+        their rate limits. If omitted, the action in lower case.
+    rate_limits : dict
+        Optional rate limits configuration, see RateLimiter.
+    rate_limiter : RateLimiter
+        Drops commands sent faster than the rate limits allow,
+        or None if no rate limits are configured.
+    preload_followers : bool
+        Whether to load the broadcaster's complete follower list
+        in the background, so follower checks need no API calls.
+    scheduler_interval : float
+        How often the core wakes up while the IRC reactor has
+        scheduled work pending (e.g. a reconnect attempt) whose
+        due time can't be read from the reactor's scheduler.
+    enrichment_deadline : float
+        How long a command may wait for its follower status
+        lookup before it is passed on with the last known
+        status instead.
+    enrichment_stats : collections.Counter
+        Counters for commands enriched in time, commands which
+        hit the deadline, commands which skipped the lookup,
+        failed lookups, and lookup latency.
+    filter_stats : collections.Counter
+        Counters for chat messages received, and for messages
+        dropped at each stage of on_pubmsg.
+    chat : ChatScheduler
+        Queue of messages to say in chat, sent as fast as
+        Twitch's rate limits allow.
 
     Methods
     -------
     start() -> no return
-        Loops forever. Gets the latest messages from the IRC server,
+        Loops forever. Waits for messages from the IRC server,
         parses them for commands, and manages both input and output
         queues. Send a "shutdown" command via the input queue to quit.
     """
@@ -126,17 +210,40 @@ class TwitchBotCore(irc.bot.SingleServerIRCBot):
                  cooldown, timeout,
                  api_client_id,
                  api_client_secret,
-                 no_cooldown):
+                 no_cooldown,
+                 api_options = None,
+                 follower_status_required = None,
+                 preload_followers = False,
+                 is_known_command = None,
+                 canonical_command = None,
+                 rate_limits = None):
         self.chat_token  = chat_token
         self.channel     = channel
         self.cooldown    = cooldown
         self.timeout     = timeout
         self.out_queue   = out_queue
         self.in_queue    = in_queue
-        self.no_cooldown = set(no_cooldown)
+        self.no_cooldown = set(name.lower() for name in no_cooldown)
+        self.follower_status_required = follower_status_required
+        self.is_known_command = is_known_command
+        self.canonical_command = canonical_command
+        if rate_limits:
+            self.rate_limiter = RateLimiter.from_config(rate_limits)
+        else:
+            self.rate_limiter = None
+        self.scheduler_interval = 1.0
+        self.enrichment_deadline = 2.0
+        self.enrichment_stats    = Counter()
+        self.filter_stats        = Counter()
+        self.enrichment_lock     = threading.Lock()
+        self.pending_commands    = deque()
+        self.chat                = ChatScheduler(
+            self._send_chat,
+            max_bytes = message_budget(username, channel))
 
         self.twitch_api = TwitchApi(api_client_id,
-                                    api_client_secret)
+                                    api_client_secret,
+                                    **(api_options or {}))
 
         self.log = logging.getLogger(__name__)
 
@@ -144,6 +251,14 @@ class TwitchBotCore(irc.bot.SingleServerIRCBot):
         # Here we assume the channel name is the same as the
         # name of the broadcaster we are running for.
         self.user_id = self.twitch_api.get_user_id(self.channel.lstrip("#"))
+        if preload_followers:
+            self.follower_list = FollowerList(self.twitch_api, self.user_id)
+            self.follower_list.start()
+        else:
+            self.follower_list = None
+        self.follower_resolver = FollowerResolver(
+            self.twitch_api, self.user_id,
+            follower_list = self.follower_list)
 
         self.log.info("Connecting to " + server + " on port " + str(port) + "...")
 
@@ -159,29 +274,19 @@ class TwitchBotCore(irc.bot.SingleServerIRCBot):
         self.log.info("Disconnecting...")
         self.connection.disconnect()
 
-    def _get_user_info(self, source, badges, tags):
-        """Gets user info (name, privileges) from chat tags and API"""
+    def _get_user_info(self, source, badges):
+        """Gets user info (name, privileges) from chat tags.
+        
+        The follower status is left as None; it requires a
+        Twitch API call, which is made later, off this thread.
+        """
 
         self.log.debug("Parsing user info for source %s..." % source)
 
-        # According to spec, nickname can be <nickname!username@server>,
-        # <nickname@server>, or <nickname>, so try all three.
-
-        if "!" in source:
-            name = source.split("!", 1)[0]
-        elif "@" in source:
-            name = source.split("@", 1)[0]
-        else:
-            name = source
+        name = self._source_name(source)
 
-        # Need to query twitch API to get follower status; other
-        # statuses are included with the chat data as badges.
-        try:
-            follower = self.twitch_api.is_follower(tags["user-id"],
-                                                   self.user_id)
-        except requests.RequestException as e:
-            self.log.warning("Error getting follower info from API: %s" % str(e))
-            follower = False
+        # Other statuses are included with the chat data as badges.
+        follower    = None
         moderator   = True if "moderator" in badges else False
         broadcaster = True if "broadcaster" in badges else False
         subscriber  = True if "subscriber" in badges else False
@@ -204,26 +309,66 @@ class TwitchBotCore(irc.bot.SingleServerIRCBot):
                           moderator,
                           broadcaster)
 
-    def _parse_command(self, e):
-        """Parses a twitch message and turns it into a command."""
+    def _source_name(self, source):
+        """Returns the name of the user who sent a message."""
 
-        # Extract command and arguments, if present. Wrapping in a catch-all
-        # because of behavior from the IRC Python library that I won't touch
-        # with a 1000m long telephone pole.
-        cmd = ""
-        try:
-            cmd = re.findall(r'!\w+', e.arguments[0])[0].lstrip("! ")
-        except:
-            self.log.warning("Couldn't parse Twitch argument")
+        # According to spec, nickname can be <nickname!username@server>,
+        # <nickname@server>, or <nickname>, so try all three.
 
-        if " " in cmd:
-            action, args = cmd.split(" ", 1)
+        if "!" in source:
+            return source.split("!", 1)[0]
+        elif "@" in source:
+            return source.split("@", 1)[0]
         else:
-            action = cmd.strip()
-            args = None
+            return source
+
+    def _command_name(self, action):
+        """Returns the name which identifies the command action."""
 
-        self.log.debug("Parsed command: %s(%s)"
-                       % (action, args))
+        if self.canonical_command is not None:
+            try:
+                return self.canonical_command(action)
+            except Exception as e:
+                self.log.warning("Error getting the name of command '%s':"
+                                 " %s" % (action, str(e)))
+        return action.lower()
+
+    def _rate_limited(self, e, action):
+        """Returns true if a command is over its rate limits.
+
+        The broadcaster is never rate limited.
+        """
+
+        if self.rate_limiter is None:
+            return False
+        user = self._source_name(e.source)
+        if user == self.channel.lstrip("#"):
+            return False
+        bucket = self.rate_limiter.allow(user, self._command_name(action))
+        if bucket is None:
+            return False
+        self.log.debug("IGNORING command '%s' from user '%s'"
+                       " (over the %s rate limit)" % (action, user, bucket))
+        return True
+
+    def _known_command(self, action):
+        """Returns true if the bot has a command called action."""
+
+        if self.is_known_command is None:
+            return True
+        try:
+            return self.is_known_command(action)
+        except Exception as e:
+            self.log.warning("Error checking whether command '%s'"
+                             " exists: %s" % (action, str(e)))
+            return True
+
+    def _parse_command(self, e, action, args):
+        """Turns a twitch message into a command.
+
+        Parses the tags, badges and user info of the message
+        for the action and args found by on_pubmsg.
+        """
 
         # Extract tags, which are stored as a list
         # of two-element dictionaries containing
@@ -260,10 +405,9 @@ class TwitchBotCore(irc.bot.SingleServerIRCBot):
             self.log.debug("Didn't find any badges in tags for action '%s'."
                            % action)
 
-        # Get user info from twitch chat data and API
+        # Get user info from twitch chat data
         user = self._get_user_info(e.source,
-                                   badges,
-                                   tags)
+                                   badges)
 
         return TwitchCommand(tags,
                              badges,
@@ -271,6 +415,152 @@ class TwitchBotCore(irc.bot.SingleServerIRCBot):
                              action,
                              args)
 
+    def _enqueue(self, cmd, key, gated):
+        """Passes a command to the main thread once it is enriched.
+        
+        The follower status lookup is handed to the follower
+        resolver, and the command is admitted to the output
+        queue, under the name key, when the lookup completes.
+        If it does not complete before the enrichment
+        deadline, the core loop passes the command on with the
+        last known status instead.
+        Commands may therefore leave in a different order
+        than they arrived in.
+        """
+
+        user_id = cmd.tags.get("user-id")
+        if user_id is None:
+            self._admit(self._with_follower(cmd, False), key, gated)
+            return
+
+        if not self._needs_follower_status(cmd):
+            self.log.debug("Skipping follower lookup for command '%s'"
+                           " from user '%s'."
+                           % (cmd.action, cmd.user.name))
+            with self.enrichment_lock:
+                self.enrichment_stats["skipped"] += 1
+            self._admit(cmd, key, gated)
+            return
+
+        now = time.monotonic()
+        pending = _PendingCommand(cmd, key, gated, user_id, now,
+                                  now + self.enrichment_deadline)
+        future = self.follower_resolver.resolve(user_id)
+        if not future.done():
+            self.pending_commands.append(pending)
+        future.add_done_callback(
+            lambda future: self._on_follower_resolved(pending, future))
+
+    def _admit(self, cmd, key, gated):
+        """Puts a command in the output queue, unless it's shed.
+        
+        This may run on a follower resolver worker thread.
+        """
+
+        if not self.out_queue.put(cmd, key, gated):
+            self.log.info("Dropping command '%s(%s)' from user '%s'"
+                          " (too many commands waiting)."
+                          % (cmd.action, str(cmd.args), cmd.user.name))
+
+    def _needs_follower_status(self, cmd):
+        """Returns true if a command needs a follower status lookup.
+        
+        Subscribers, moderators and the broadcaster already
+        rank above followers, so their follower status never
+        changes what they are allowed to do. For everyone else,
+        the bot decides per command.
+        """
+
+        if (cmd.user.subscriber
+                or cmd.user.moderator
+                or cmd.user.broadcaster):
+            return False
+        if self.follower_status_required is None:
+            return True
+        try:
+            return self.follower_status_required(cmd.action)
+        except Exception as e:
+            self.log.warning("Error checking whether command '%s' needs"
+                             " follower status: %s" % (cmd.action, str(e)))
+            return True
+
+    def _with_follower(self, cmd, follower):
+        """Returns cmd with the user's follower status filled in."""
+
+        return cmd._replace(user = cmd.user._replace(follower = follower))
+
+    def _on_follower_resolved(self, pending, future):
+        """Finishes enriching a command once its lookup completes.
+        
+        This usually runs on a follower resolver worker thread.
+        """
+
+        try:
+            follower = future.result()
+        except Exception as e:
+            self.log.warning("Error getting follower info from API: %s" % str(e))
+            with self.enrichment_lock:
+                self.enrichment_stats["failed"] += 1
+            follower = self.follower_resolver.last_known(pending.user_id)
+        self._finish_enrichment(pending, follower, False)
+
+    def _finish_enrichment(self, pending, follower, timed_out):
+        """Puts an enriched command in the output queue, exactly once."""
+
+        with self.enrichment_lock:
+            if pending.finished:
+                return
+            pending.finished = True
+            latency = time.monotonic() - pending.started
+            if timed_out:
+                self.enrichment_stats["deadline_fallback"] += 1
+            else:
+                self.enrichment_stats["enriched"] += 1
+            self.enrichment_stats["latency_total"] += latency
+            if latency > self.enrichment_stats["latency_max"]:
+                self.enrichment_stats["latency_max"] = latency
+
+        if timed_out:
+            self.log.warning("Follower status of user '%s' not known after"
+                             " %.2f seconds; using last known status (%s)."
+                             % (pending.cmd.user.name, latency, follower))
+        self._admit(self._with_follower(pending.cmd, follower),
+                    pending.key, pending.gated)
+
+    def _expire_pending_commands(self):
+        """Passes on commands whose enrichment deadline has passed."""
+
+        now = time.monotonic()
+        while self.pending_commands:
+            pending = self.pending_commands[0]
+            if not pending.finished and pending.deadline > now:
+                return
+            self.pending_commands.popleft()
+            if not pending.finished:
+                self._finish_enrichment(
+                    pending,
+                    self.follower_resolver.last_known(pending.user_id),
+                    True)
+
+    def get_enrichment_stats(self):
+        """Returns follower enrichment metrics.
+        
+        Returns
+        -------
+        dict
+            The number of commands enriched in time, passed on
+            at the deadline, and whose lookup failed, along with
+            the average and maximum lookup latency in seconds.
+        """
+
+        with self.enrichment_lock:
+            stats = dict(self.enrichment_stats)
+        completed = (stats.get("enriched", 0)
+                     + stats.get("deadline_fallback", 0))
+        stats["latency_average"] = (stats.get("latency_total", 0.0)
+                                    / completed if completed else 0.0)
+        return stats
+
     def on_welcome(self, c, e):
         """Joins the desired channel and requests capabilities.
         
@@ -287,43 +577,89 @@ class TwitchBotCore(irc.bot.SingleServerIRCBot):
         c.cap('REQ', ':twitch.tv/commands')
         c.join(self.channel)
 
+    def on_userstate(self, c, e):
+        """Notes whether the bot is a moderator in the channel.
+        
+        Twitch sends the bot's own tags on joining the channel
+        and after every message it says. Moderators, and the
+        broadcaster, may say more messages in a row.
+        """
+
+        if e.target != self.channel:
+            return
+        tags = dict()
+        for tag in e.tags:
+            try:
+                tags[tag["key"]] = tag["value"]
+            except (TypeError, KeyError):
+                pass
+        moderator = (tags.get("mod") == "1"
+                     or "broadcaster/" in (tags.get("badges") or ""))
+        if moderator != self.chat.moderator:
+            self.log.info("Bot is %sa moderator in %s; adjusting chat"
+                          " rate limit." % ("" if moderator else "not ",
+                                            self.channel))
+            self.chat.set_moderator(moderator)
+
     def on_pubmsg(self, c, e):
         """Reacts to a message sent to the twitch channel.
         
-        Looks for a command in the given message, and manages
-        the cooldown timer and output queue.
+        Most chat isn't a command the bot has, so each message
+        goes through a series of filters, cheapest first, and
+        is dropped as soon as one of them rejects it:
+        
+        1. Is it a command at all? (one precompiled regex)
+        2. Does the bot have that command?
+        3. Is the command within its rate limits?
+        4. Parse the tags, badges and user info.
+        5. Look up the follower status, if needed (see _enqueue).
+        
+        filter_stats counts the messages dropped at each stage.
+        Commands which pass every stage go to the admission
+        queue, where they wait for the cooldown unless they are
+        whitelisted.
         """
 
+        self.filter_stats["messages"] += 1
+
         # Ignore messages unless sent to channel of interest.
         if e.target != self.channel:
+            self.filter_stats["other_channel"] += 1
             return
-        
+
         # Ignore messages that don't start with an exclamation point.
-        #if not e.arguments[0].startswith('!'):
-        if not '!' in e.arguments[0][0:3]:
+        match = _COMMAND_PATTERN.match(e.arguments[0])
+        if match is None:
+            self.filter_stats["not_command"] += 1
             self.log.debug("IGNORING command, no ! present")
             return
+        action, args = match.group(1), (match.group(2) or "").strip() or None
 
-        # Parse the command and place it in the queue if cooldown not active.
-        cmd = self._parse_command(e)
-        if cmd.action in self.no_cooldown:
+        # Ignore commands the bot doesn't have.
+        if not self._known_command(action):
+            self.filter_stats["unknown_command"] += 1
+            self.log.debug("IGNORING unknown command '%s'" % action)
+            return
+
+        # Ignore commands sent faster than the rate limits allow.
+        if self._rate_limited(e, action):
+            self.filter_stats["rate_limited"] += 1
+            return
+
+        # Parse the command and place it in the queue.
+        cmd = self._parse_command(e, action, args)
+        self.filter_stats["accepted"] += 1
+        key = self._command_name(action)
+        whitelisted = key in self.no_cooldown
+        if whitelisted:
             self.log.info("Received whitelisted command '%s(%s)'"
                           " from user '%s' in chat; adding to queue."
                           % (cmd.action, str(cmd.args), cmd.user.name))
-            self.out_queue.put(cmd)
         else:
-            if isclose(self.cooldown_timer, 0.0, rel_tol = 1e-5):
-                self.log.info("Received command '%s(%s)'"
-                              " from user '%s' in chat; adding to queue."
-                              % (cmd.action, str(cmd.args), cmd.user.name))
-                self.out_queue.put(cmd)
-                if self.timeout is not None:
-                    self.cooldown_timer = self.timeout
-            else:
-                self.log.info("Ignoring command '%s(%s)'"
-                              " from user '%s' in chat"
-                              " (received during cooldown)."
-                              % (cmd.action, str(cmd.args), cmd.user.name))
+            self.log.info("Received command '%s(%s)'"
+                          " from user '%s' in chat; adding to queue."
+                          % (cmd.action, str(cmd.args), cmd.user.name))
+        self._enqueue(cmd, key, not whitelisted)
 
     def run_command(self, cmd):
         """Runs a command which came in via the input queue."""
@@ -336,79 +672,148 @@ class TwitchBotCore(irc.bot.SingleServerIRCBot):
             self.log.debug("Saying '%s'." % args)
             if isinstance(cmd.args, str):
                 args = cmd.args.splitlines()
+            supersede = cmd.tags.get("supersede") if cmd.tags else None
             for arg in args:
-                # IRC limits 512 bytes per message, anything too long must be truncated
-                # problem is the python IRC lib does NOT return the message sent to the 
-                # bot's queue so we cannot determine the full size of the message as it
-                # includes the tags, channel, etc. Therefore, we approximate by limiting 
-                # the size of the string itself. 
-                # Because Fuck You that's why.
-                # Why 450? Because Twitch truncates messages at 499 characters ish
-                # for my channel name. Channel name is variable but can be up to 25 chars
-                # and we want to add a truncated message to it. Close enough. XD
-                if(len(arg) > 450):
-                    arg = arg[:450] + "...[message truncated]"
-                self.connection.privmsg(self.channel, arg)
+                # IRC limits lines to 512 bytes, including the prefix Twitch
+                # adds when relaying the message. Lines which don't fit are
+                # split into several messages by the chat scheduler.
+                self.chat.say(arg, supersede)
         elif cmd.action == "done":
             self.log.debug("Starting cooldown timer.")
-            self.cooldown_timer = self.cooldown
+            self.set_cooldown_timer(self.cooldown)
         elif cmd.action == "failed":
             self.log.debug("Resetting cooldown timer.")
-            self.cooldown_timer = 0.0
+            self.set_cooldown_timer(0.0)
         elif cmd.action == "sleep":
             try:
                 self.log.debug("Setting cooldown timer to %s seconds."
                                % cmd.args)
-                self.cooldown_timer = float(cmd.args)
+                self.set_cooldown_timer(float(cmd.args))
             except (ValueError, TypeError):
                 pass # silently fail for now
         elif cmd.action == "shutdown":
             self.log.info("Shutting down Twitch bot core.")
+            self.follower_resolver.shutdown()
+            if self.follower_list is not None:
+                self.follower_list.stop()
+            self.log.info("Follower resolver stats: %s"
+                          % dict(self.follower_resolver.stats))
+            self.log.info("Follower enrichment stats: %s"
+                          % self.get_enrichment_stats())
+            self.log.info("Chat filter stats: %s"
+                          % dict(self.filter_stats))
+            if self.rate_limiter is not None:
+                self.log.info("Rate limiter stats: %s"
+                              % self.rate_limiter.get_stats())
+            self.log.info("Admission queue stats: %s"
+                          % self.out_queue.get_stats())
+            self.chat.flush()
+            self.log.info("Chat scheduler stats: %s"
+                          % self.chat.get_stats())
+            self.twitch_api.close()
             self.out_queue.put(cmd)
             raise SystemExit()
         else:
             self.log.info("Did not recognize command '%s'."
                           % cmd.action)
 
+    def _send_chat(self, text):
+        """Says a message in chat, for the chat scheduler."""
+
+        try:
+            self.connection.privmsg(self.channel, text)
+        except irc.client.ServerNotConnectedError:
+            self.log.warning("Not connected to chat; could not say '%s'."
+                             % text)
+
     def init_cooldown_timer(self):
         """Initializes the cooldown timer.
         
-        Set the cooldown timer to zero initially,
-        and measure the current time so when we
-        update we get a sane value for dt.
+        The cooldown timer is held by the output queue, which
+        releases waiting commands when it expires, and restarts
+        it for timeout seconds whenever it releases one.
+        Initially no cooldown is active.
         """
         
         self.log.debug("Initializing cooldown timer.")
-        self.cooldown_timer = 0.0
-        self.current_time = time.monotonic()
+        self.out_queue.set_cooldown(0.0)
+
+    def set_cooldown_timer(self, duration):
+        """Sets the cooldown timer to expire after duration seconds."""
+
+        self.out_queue.set_cooldown(duration)
+
+    def cooldown_active(self):
+        """Returns true if the cooldown timer has not yet expired."""
 
-    def update_cooldown_timer(self):
-        """Updates the cooldown timer.
+        return self.out_queue.cooldown_active()
+
+    def _select_timeout(self):
+        """Returns how long the event loop may sleep in select().
         
-        Updates the timer as follows:
-            dt = elapsed time since last call
-            timer = max(0.0, timer - dt)
+        The loop only needs to wake up on its own when the
+        IRC reactor's next scheduled job (such as a reconnect
+        attempt) is due, when a command reaches its enrichment
+        deadline, when the chat rate limit allows the next
+        waiting message to be sent, or when an SSL socket
+        already holds decrypted data that select() cannot see.
+        Otherwise, it sleeps until the server or the main
+        thread sends something.
         """
 
-        # Calculate dt
-        new_time = time.monotonic()
-        dt = new_time - self.current_time
-        self.current_time = new_time
+        if any(map(_has_pending_data, self.reactor.sockets)):
+            return 0.0
+        timeout = self._scheduler_timeout()
+        if self.pending_commands:
+            deadline = max(0.0, self.pending_commands[0].deadline
+                                - time.monotonic())
+            if timeout is None or deadline < timeout:
+                timeout = deadline
+        send_in = self.chat.next_send_in()
+        if send_in is not None and (timeout is None or send_in < timeout):
+            timeout = send_in
+        return timeout
+
+    def _scheduler_timeout(self):
+        """Returns how long until the reactor's next scheduled job.
+        
+        The scheduler keeps its jobs sorted by due time, as UTC
+        datetimes. Returns None if nothing is scheduled.
+        """
 
-        # Decrement the cooldown timer
-        self.cooldown_timer -= dt
-        if self.cooldown_timer < 0.0:
-            if self.cooldown_timer + dt > 0.0:
-                self.log.debug("Cooldown timer reached zero.")
-            self.cooldown_timer = 0.0
+        queue = self.reactor.scheduler.queue
+        if not queue:
+            return None
+        try:
+            due_in = queue[0] - datetime.datetime.now(datetime.timezone.utc)
+            return max(0.0, due_in.total_seconds())
+        except (TypeError, AttributeError):
+            return self.scheduler_interval
+
+    def _process_in_queue(self):
+        """Runs every command currently waiting in the input queue."""
+
+        # Clear the wakeup signal before draining, so any
+        # command put after this point wakes the loop again.
+        self.in_queue.clear_wakeup()
+        while True:
+            try:
+                cmd = self.in_queue.get_nowait()
+            except Empty:
+                return
+            self.run_command(cmd)
 
     def start(self):
         """Start and manage the Twitch bot core.
         
         This method is responsible for starting the bot,
-        polling for messages from the server, updating the
-        cooldown timer, and running commands received
-        from the input queue.
+        waiting for messages from the server, and running
+        commands received from the input queue.
+        
+        The IRC socket and the input queue are waited on
+        together with a single select() call, so messages
+        from either side are handled as soon as they arrive
+        and the thread does not wake up while chat is idle.
         """
 
         self.log.debug("Starting Twitch bot core.")
@@ -416,9 +821,15 @@ class TwitchBotCore(irc.bot.SingleServerIRCBot):
         self.init_cooldown_timer()
         self.log.debug("Twitch bot core started. Processing commands.")
         while True:
-            self.reactor.process_once(timeout = 0.15)
-            self.update_cooldown_timer()
-            try:
-                self.run_command(self.in_queue.get_nowait())
-            except Empty:
-                pass
+            sockets = self.reactor.sockets
+            readable, _, _ = select.select(sockets + [self.in_queue], [], [],
+                                           self._select_timeout())
+            # SSL sockets may hold buffered data without being readable.
+            self.reactor.process_data(
+                [sock for sock in sockets
+                 if sock in readable or _has_pending_data(sock)])
+            self.reactor.process_timeout()
+            self._expire_pending_commands()
+            if self.in_queue in readable:
+                self._process_in_queue()
+            self.chat.flush()
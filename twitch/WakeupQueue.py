@@ -0,0 +1,63 @@
+from queue import Queue
+import socket
+
+
+class WakeupQueue(Queue):
+    """
+    A queue which can be waited on with select().
+
+    Behaves exactly like Python's Queue.Queue, but also owns
+    a connected socket pair. Every put writes a single byte to
+    one end of the pair, which makes the other end readable,
+    so a thread blocked in select() on this queue wakes up
+    the moment a new item arrives.
+
+    Objects of this class can be passed directly to select()
+    because they implement fileno().
+
+    Methods
+    -------
+    fileno() -> int
+        Returns the file descriptor which becomes readable
+        whenever an item is put into the queue.
+    clear_wakeup()
+        Consumes all pending wakeup bytes. Call this before
+        draining the queue so no wakeups are lost.
+    close()
+        Closes the underlying socket pair.
+    """
+
+    def __init__(self, maxsize = 0):
+        super().__init__(maxsize)
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+
+    def _put(self, item):
+        super()._put(item)
+        try:
+            self._wakeup_send.send(b"\0")
+        except (BlockingIOError, InterruptedError):
+            # The socket buffer is full, meaning the reader
+            # already has plenty of pending wakeups.
+            pass
+
+    def fileno(self):
+        """Returns the file descriptor to select() on."""
+
+        return self._wakeup_recv.fileno()
+
+    def clear_wakeup(self):
+        """Consumes all pending wakeup bytes."""
+
+        try:
+            while self._wakeup_recv.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def close(self):
+        """Closes the underlying socket pair."""
+
+        self._wakeup_recv.close()
+        self._wakeup_send.close()